@@ -0,0 +1,34 @@
+"""
+Imports the add-on modules that do not need Blender, for the benchmarks.
+
+looking_glass_tools/__init__.py imports bpy, so the package is set up here without
+running it: its submodules import as looking_glass_tools.<name> as long as they (and
+what they import) do not import bpy, bgl or gpu themselves. The vendored cbor package
+is also importable as top-level `cbor`, like the tests use it.
+"""
+
+import importlib
+import os
+import sys
+import types
+
+ADDON_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'looking_glass_tools')
+
+if ADDON_DIR not in sys.path:
+    sys.path.insert(0, ADDON_DIR)
+
+
+def addon_package():
+    """ sets up the looking_glass_tools package without running its __init__.py, so
+    `import looking_glass_tools.<name>` only imports that module """
+    if 'looking_glass_tools' not in sys.modules:
+        package = types.ModuleType('looking_glass_tools')
+        package.__path__ = [ADDON_DIR]
+        sys.modules['looking_glass_tools'] = package
+    return sys.modules['looking_glass_tools']
+
+
+def import_addon_module(name):
+    """ imports looking_glass_tools.<name> without importing looking_glass_tools/__init__.py """
+    addon_package()
+    return importlib.import_module('looking_glass_tools.' + name)
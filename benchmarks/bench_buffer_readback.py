@@ -0,0 +1,71 @@
+"""
+Times turning a quilt readback buffer into a uint8 numpy array, the old way through
+Buffer.to_list() and the new way as a view through the buffer protocol.
+
+bgl only exists inside Blender, so a ctypes array of signed bytes stands in for
+bgl.Buffer(GL_BYTE, n): it has the same memory layout, supports the buffer protocol
+like bgl.Buffer does since Blender 2.80, and its to_list() builds one Python int per
+byte like bgl's. The two conversions are copied from
+OffScreenDraw.buffer_to_uint8_array in looking_glass_live_view.py, which imports bgl
+and can not be imported here.
+
+    python benchmarks/bench_buffer_readback.py [--width 4096] [--height 4096] [--repeat 3]
+
+Inside Blender, OffScreenDraw.benchmark_buffer_to_uint8_array() times the real bgl.Buffer.
+"""
+
+import argparse
+import ctypes
+import timeit
+
+import numpy as np
+
+
+def make_buffer(size):
+    """ a bgl.Buffer(GL_BYTE, size) stand-in filled with random bytes """
+    class Buffer(ctypes.c_byte * size):
+        def to_list(self):
+            return self[:]
+    buffer = Buffer()
+    np.frombuffer(buffer, dtype=np.uint8)[:] = np.random.randint(0, 256, size, dtype=np.uint8)
+    return buffer
+
+
+def list_round_trip(buffer):
+    # what copy_quilt_from_texture_to_numpy_array did, and the fallback for bgl without the buffer protocol
+    return np.array(buffer.to_list(), dtype=np.int8).view(np.uint8)
+
+
+def buffer_view(buffer):
+    return np.frombuffer(buffer, dtype=np.uint8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=4096)
+    parser.add_argument('--height', type=int, default=4096)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    buffer = make_buffer(args.width * args.height * 4)
+    expected = list_round_trip(buffer)
+    view = buffer_view(buffer)
+    assert np.array_equal(expected, view), "the buffer view differs from the list round-trip"
+    assert np.shares_memory(view, np.ctypeslib.as_array(buffer)), "the buffer view is a copy"
+    del expected
+
+    print("RGBA quilt %dx%d, %d bytes" % (args.width, args.height, len(view)))
+    best = {}
+    for i in range(args.repeat):
+        for name, convert in (("list round-trip", list_round_trip), ("buffer view", buffer_view)):
+            start_time = timeit.default_timer()
+            convert(buffer)
+            elapsed = timeit.default_timer() - start_time
+            best[name] = min(best.get(name, elapsed), elapsed)
+            print("%-16s %.6f s" % (name, elapsed))
+    print("best: list round-trip %.6f s, buffer view %.6f s, %.0fx faster"
+          % (best["list round-trip"], best["buffer view"], best["list round-trip"] / max(best["buffer view"], 1e-9)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""
+Times cbor.dumps on the HoloPlay Service command dicts and on a large nested document.
+
+The vendored cbor package is timed as it is in this tree: the pure Python encoder in
+cbor/cbor.py, and the C accelerator too when it has been built with cbor/_cbor_build.py.
+To compare against an older encoder, pass a copy of its cbor.py, or a git revision to
+read it from. The baseline has to produce the same bytes, which is checked first.
+
+    python benchmarks/bench_cbor_encoder.py [--records 5000] [--repeat 7]
+    python benchmarks/bench_cbor_encoder.py --baseline-rev <rev> [--baseline-rev <rev> ...]
+    python benchmarks/bench_cbor_encoder.py --baseline path/to/cbor.py
+
+Templates (cbor.Template) only exist in newer encoders, so the template filled commands
+are only timed with this tree's encoder.
+"""
+
+import argparse
+import importlib.util
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import timeit
+
+from _addon import ADDON_DIR, import_addon_module
+
+import cbor
+from cbor import cbor as pure_cbor
+
+commands = import_addon_module('holoplay_service_api_commands')
+
+REPO_DIR = os.path.dirname(ADDON_DIR)
+
+
+def quilt_settings():
+    return {'vx': 5, 'vy': 9, 'vtotal': 45, 'aspect': 0.75}
+
+
+def command_dicts(blob):
+    """ the commands holoplay_service_api_commands built before it used templates, as plain dicts """
+    return {
+        'hide': {'cmd': {'hide': {}}, 'bin': bytes()},
+        'load_quilt': {'cmd': {'show': {'source': 'cache', 'quilt': {'name': 'blender_quilt_0', 'settings': quilt_settings()}}}, 'bin': bytes()},
+        'show_quilt': {'cmd': {'show': {'source': 'bindata', 'quilt': {'type': 'image', 'settings': quilt_settings()}}}, 'bin': blob},
+        'cache_quilt': {'cmd': {'cache': {'quilt': {'name': 'blender_quilt_0', 'type': 'image', 'settings': quilt_settings()}}}, 'bin': blob},
+    }
+
+
+def template_commands(blob):
+    """ the same commands as holoplay_service_api_commands builds them now """
+    settings = commands.make_quilt_settings(5, 9, 0.75)
+    return {
+        'hide': commands.hide(),
+        'load_quilt': commands.load_quilt('blender_quilt_0', settings),
+        'show_quilt': commands.show_quilt(blob, settings),
+        'cache_quilt': commands.cache_quilt(blob, 'blender_quilt_0', settings),
+    }
+
+
+def nested_document(records, seed=0):
+    """ a list of `records` dicts mixing small and large ints, floats, short and long text,
+    bytes, bools, None and nested lists and maps, with the same keys in every record """
+    rng = random.Random(seed)
+    document = []
+    for i in range(records):
+        document.append({
+            'id': i,
+            'name': 'object_%d' % rng.randrange(1000),
+            'visible': rng.random() < 0.5,
+            'parent': None if rng.random() < 0.3 else rng.randrange(records),
+            'location': [rng.uniform(-10, 10) for j in range(3)],
+            'scale': [1.0, 1.0, 1.0],
+            'frame': rng.randrange(250),
+            'size': rng.randrange(1 << 40),
+            'tags': ['quilt', 'view_%d' % rng.randrange(45)],
+            'material': {'name': 'Material.%03d' % rng.randrange(100), 'index': rng.randrange(8), 'alpha': rng.random()},
+            'notes': 'x' * rng.randrange(100),
+            'hash': bytes(rng.randrange(256) for j in range(16)),
+        })
+    return document
+
+
+def load_baseline(path, name):
+    """ imports a standalone copy of cbor/cbor.py as module `name` """
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_baseline_rev(rev, name, tmpdir):
+    source = subprocess.check_output(['git', 'show', rev + ':looking_glass_tools/cbor/cbor.py'], cwd=REPO_DIR)
+    path = os.path.join(tmpdir, name + '.py')
+    with open(path, 'wb') as f:
+        f.write(source)
+    return load_baseline(path, name)
+
+
+def best_time(function, repeat):
+    """ seconds per call, best of `repeat` runs of as many calls as take about 0.2 s """
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def format_time(seconds):
+    if seconds < 1e-3:
+        return "%.2f us" % (seconds * 1e6)
+    return "%.2f ms" % (seconds * 1e3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--records', type=int, default=5000, help="records in the nested document")
+    parser.add_argument('--blob', type=int, default=1024, help="bytes of quilt data in show_quilt and cache_quilt")
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--baseline', action='append', default=[], metavar='PATH', help="a copy of an older cbor/cbor.py")
+    parser.add_argument('--baseline-rev', action='append', default=[], metavar='REV', help="git revision to read cbor/cbor.py from")
+    args = parser.parse_args()
+
+    blob = bytes(random.Random(1).randrange(256) for i in range(args.blob))
+    workloads = dict(command_dicts(blob))
+    workloads['nested document'] = nested_document(args.records)
+    # long arrays of plain numbers are what the C accelerator encodes in C
+    rng = random.Random(2)
+    workloads['float arrays'] = [[rng.random() for j in range(1000)] for i in range(100)]
+    template_workloads = dict(('%s (template)' % name, ob) for name, ob in template_commands(blob).items())
+
+    encoders = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for i, path in enumerate(args.baseline):
+            encoders.append((os.path.basename(path), load_baseline(path, 'cbor_baseline_%d' % i)))
+        for i, rev in enumerate(args.baseline_rev):
+            encoders.append((rev, load_baseline_rev(rev, 'cbor_baseline_rev_%d' % i, tmpdir)))
+    encoders.append(("pure python", pure_cbor))
+    if cbor.use_accelerator():
+        encoders.append(("C accelerator", cbor._impl))
+
+    for name, ob in workloads.items():
+        expected = pure_cbor.dumps(ob)
+        for label, module in encoders:
+            assert module.dumps(ob) == expected, "%s encodes %s differently" % (label, name)
+    # encoders from before templates were added can not encode the template filled commands
+    template_encoders = set()
+    for label, module in encoders:
+        if hasattr(module, 'Template') or hasattr(module, '_pure'):
+            template_encoders.add(label)
+            for name, ob in template_workloads.items():
+                assert module.dumps(ob) == pure_cbor.dumps(workloads[name.split(' ')[0]]), "%s encodes %s differently" % (label, name)
+
+    print("Python %s, best of %d" % (sys.version.split()[0], args.repeat))
+    print("%-32s" % "" + "".join("%18s" % label[-18:] for label, module in encoders))
+    for name, ob in list(workloads.items()) + list(template_workloads.items()):
+        row = "%-32s" % name
+        for label, module in encoders:
+            if name in template_workloads and label not in template_encoders:
+                row += "%18s" % "-"
+                continue
+            row += "%18s" % format_time(best_time(lambda: module.dumps(ob), args.repeat))
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
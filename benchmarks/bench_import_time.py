@@ -0,0 +1,114 @@
+"""
+Reports how long importing the add-on modules takes, from `python -X importtime`, and
+checks that the heavy modules are still loaded lazily.
+
+Each module is imported in a fresh interpreter. Outside Blender only the modules that do
+not import bpy can be imported; when bpy is importable (Blender's Python, or the bpy
+module from PyPI) the whole add-on package is imported as well. The script exits with 1
+when a module takes longer than the budget or loads one of the heavy modules, so it can
+be run as a check.
+
+    python benchmarks/bench_import_time.py [--budget-ms 50] [--repeat 5] [--top 8]
+
+Inside Blender, registering the add-on prints the same budget check, see
+REGISTRATION_BUDGET in looking_glass_tools/__init__.py.
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+# the add-on modules that import without Blender
+ADDON_MODULES = ("lazy_import", "holoplay_service_api_commands", "quilt_encoding")
+# what registering must not load, like HEAVY_MODULES in looking_glass_tools/__init__.py
+HEAVY_MODULES = ("numpy", "PIL", "pynng", "_cffi_backend", "cffi", "cbor",
+                 "looking_glass_tools.cffi", "looking_glass_tools.cbor")
+# imported on their own, to show what loading them lazily saves
+DEFERRED_MODULES = ("numpy", "cbor", "PIL", "pynng")
+
+# -X importtime only reports import statements, not importlib.import_module()
+_ADDON_IMPORT = "sys.path.insert(0, %r); from _addon import addon_package; addon_package(); import looking_glass_tools.%%s" % BENCHMARKS_DIR
+_PACKAGE_IMPORT = "sys.path.insert(0, %r); import looking_glass_tools" % REPO_DIR
+_PLAIN_IMPORT = "sys.path.insert(0, %r); import %%s" % os.path.join(REPO_DIR, 'looking_glass_tools')
+
+
+def import_time(statement, name):
+    """ runs `statement` in a fresh interpreter with -X importtime. Returns (microseconds importing
+    `name` took, [(cumulative us, module)] of the modules it imported, heavy modules loaded) """
+    code = "import sys; %s; import json; print(json.dumps([m for m in %r if m in sys.modules]))" % (statement, HEAVY_MODULES)
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError("importing %s failed:\n%s" % (name, result.stderr))
+    # lines are "import time: self [us] | cumulative | imported package", a module is reported after
+    # the modules it imported, which are indented two more spaces per level
+    lines = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        depth = (len(module) - len(module.lstrip()) - 1) // 2
+        lines.append((int(cumulative_us), module.strip(), depth))
+    for i, (total, module, depth) in enumerate(lines):
+        if module == name:
+            break
+    else:
+        return 0, [], json.loads(result.stdout.splitlines()[-1])
+    imported = []
+    for us, child, child_depth in reversed(lines[:i]):
+        if child_depth <= depth:
+            break
+        imported.append((us, child))
+    return total, imported, json.loads(result.stdout.splitlines()[-1])
+
+
+def best_import_time(statement, name, repeat):
+    # the first run may compile the .pyc files, so it does not count
+    import_time(statement, name)
+    return min((import_time(statement, name) for i in range(repeat)), key=lambda result: result[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--budget-ms', type=float, default=50.0, help="per module, REGISTRATION_BUDGET is 50 ms")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=8, help="slowest imports to list per module")
+    args = parser.parse_args()
+
+    targets = [("looking_glass_tools." + name, _ADDON_IMPORT % name) for name in ADDON_MODULES]
+    if importlib.util.find_spec('bpy') != None:
+        targets.append(("looking_glass_tools", _PACKAGE_IMPORT))
+    else:
+        print("bpy is not importable, only timing the add-on modules that do not need Blender\n")
+
+    failed = False
+    for name, statement in targets:
+        total, modules, heavy = best_import_time(statement, name, args.repeat)
+        over_budget = total > args.budget_ms * 1000
+        print("%-52s %8.2f ms%s" % (name, total / 1000.0, "  OVER BUDGET" if over_budget else ""))
+        for us, module in sorted(modules, reverse=True)[:args.top]:
+            print("    %-48s %8.2f ms" % (module, us / 1000.0))
+        if heavy:
+            print("    loaded heavy modules: " + ", ".join(heavy))
+        failed = failed or over_budget or bool(heavy)
+
+    print("\nloaded lazily, when the first quilt is sent:")
+    for name in DEFERRED_MODULES:
+        if importlib.util.find_spec(name) == None and not os.path.isdir(os.path.join(REPO_DIR, 'looking_glass_tools', name)):
+            print("    %-48s  not installed" % name)
+            continue
+        total, modules, heavy = best_import_time(_PLAIN_IMPORT % name, name, args.repeat)
+        print("    %-48s %8.2f ms" % (name, total / 1000.0))
+
+    if failed:
+        print("\nFAILED: over the %g ms budget or a heavy module was loaded" % args.budget_ms)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Times encoding a quilt for HoloPlay Service as BMP and as raw pixels, and sending the
+show_quilt command through a local socket.
+
+The encoders are the ones the add-on uses, from looking_glass_tools/quilt_encoding.py,
+and the command is built with holoplay_service_api_commands.show_quilt and encoded with
+the vendored cbor package. The PIL BMP encoding the add-on used before is timed as well
+when PIL is installed. pynng and HoloPlay Service are not needed: the command is sent
+over a socket pair to a thread that reads it, which shows what the message size costs,
+not how fast the service decodes it.
+
+    python benchmarks/bench_quilt_transports.py [--width 4096] [--height 4096] [--repeat 3]
+
+Inside Blender, looking_glass_settings.benchmark_quilt_transports(sock) times sending
+to the running HoloPlay Service.
+"""
+
+import argparse
+import importlib.util
+import io
+import socket
+import threading
+import timeit
+
+import numpy as np
+
+from _addon import import_addon_module
+
+quilt_encoding = import_addon_module('quilt_encoding')
+commands = import_addon_module('holoplay_service_api_commands')
+cbor = import_addon_module('cbor')
+
+
+def encode_pil_bmp(pixels, W, H):
+    # what send_quilt did before the BMP was written by encode_quilt_bmp
+    from PIL import Image, ImageOps
+    pimg = Image.frombytes("RGBA", (W, H), pixels.tobytes())
+    output = io.BytesIO()
+    ImageOps.flip(pimg).convert('RGBA').save(output, 'BMP')
+    return output.getvalue(), None
+
+
+TRANSPORTS = (
+    ("PIL BMP (old)", encode_pil_bmp),
+    ("BMP", lambda pixels, W, H: (quilt_encoding.encode_quilt_bmp(pixels, W, H), None)),
+    ("raw RGBA", lambda pixels, W, H: quilt_encoding.encode_quilt_raw(pixels, W, H, 4)),
+    ("raw RGB", lambda pixels, W, H: quilt_encoding.encode_quilt_raw(pixels, W, H, 3)),
+    # the readback flipped the quilt on the GPU, see looking_glass_settings.quilt_wants_top_down
+    ("raw RGB top-down", lambda pixels, W, H: quilt_encoding.encode_quilt_raw(pixels, W, H, 3, top_down=True)),
+    ("raw RGB service flips", lambda pixels, W, H: quilt_encoding.encode_quilt_raw(pixels, W, H, 3, service_flips=True)),
+)
+
+
+class LoopbackSink(object):
+    """ one end of a socket pair, a thread reads and drops what is sent to the other end """
+
+    def __init__(self):
+        self.sock, self._peer = socket.socketpair()
+        self._expected = 0
+        self._received = 0
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        buffer = bytearray(1 << 20)
+        while True:
+            count = self._peer.recv_into(buffer)
+            if count == 0:
+                return
+            with self._lock:
+                self._received += count
+                if self._received >= self._expected:
+                    self._done.set()
+
+    def send(self, data):
+        """ sends `data`, returns once the reading thread got all of it """
+        with self._lock:
+            self._expected = len(data)
+            self._received = 0
+            self._done.clear()
+        self.sock.sendall(data)
+        self._done.wait()
+
+    def close(self):
+        self.sock.close()
+        self._thread.join()
+        self._peer.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--width', type=int, default=4096)
+    parser.add_argument('--height', type=int, default=4096)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    W, H = args.width, args.height
+
+    transports = list(TRANSPORTS)
+    if importlib.util.find_spec('PIL') == None:
+        print("PIL is not installed, skipping the old PIL BMP encoding")
+        transports = transports[1:]
+
+    # bottom row first, like the pixels read back from OpenGL
+    pixels = np.random.randint(0, 256, W * H * 4, dtype=np.uint8)
+    settings = commands.make_quilt_settings(5, 9, 0.75)
+    sink = LoopbackSink()
+
+    print("RGBA quilt %dx%d, best of %d" % (W, H, args.repeat))
+    print("%-22s %10s %10s %10s %10s %10s" % ("transport", "MB", "encode s", "command s", "send s", "total s"))
+    try:
+        for name, encode in transports:
+            best = None
+            for i in range(args.repeat):
+                start_time = timeit.default_timer()
+                blob, raw_format = encode(pixels, W, H)
+                encode_time = timeit.default_timer()
+                message = cbor.dumps(commands.show_quilt(blob, settings, raw_format))
+                command_time = timeit.default_timer()
+                sink.send(message)
+                send_time = timeit.default_timer()
+                times = (encode_time - start_time, command_time - encode_time, send_time - command_time, send_time - start_time)
+                if best == None or times[3] < best[3]:
+                    best = times
+            print("%-22s %10.1f %10.6f %10.6f %10.6f %10.6f" % ((name, len(message) / 1e6) + best))
+    finally:
+        sink.close()
+
+
+if __name__ == '__main__':
+    main()
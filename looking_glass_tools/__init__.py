@@ -27,11 +27,19 @@ bl_info = {
 	"category": "View",
 	}
 
+import sys
+import timeit
+
+# measured from here, registration is reported against REGISTRATION_BUDGET in register()
+_import_start_time = timeit.default_timer()
+_modules_before_import = set(sys.modules)
+
 # required for proper reloading of the addon by using F8
 if "bpy" in locals():
 	import importlib
 	importlib.reload(looking_glass_live_view)
 	importlib.reload(looking_glass_render_setup)
+	importlib.reload(quilt_encoding)
 	importlib.reload(looking_glass_settings)
 	importlib.reload(holoplay_service_api_commands)
 else:
@@ -49,21 +57,14 @@ if "looking_glass_live_view" not in globals():
 	raise Exception(message)
 
 import bpy
-import gpu
-import json
-import subprocess
-import logging
-import os
-import platform
-import pathlib
-import ctypes
-from bgl import *
-from math import *
-from mathutils import *
-from bpy.types import AddonPreferences, PropertyGroup
 from bpy.props import FloatProperty, PointerProperty
-from bpy_extras.io_utils import ExportHelper
-from . import cbor
+
+_import_time = timeit.default_timer() - _import_start_time
+
+# seconds that importing and registering the addon may take, so it does not hold up Blender's startup
+REGISTRATION_BUDGET = 0.05
+# loaded lazily when they are first needed, registering the addon must not load them
+HEAVY_MODULES = ("numpy", "PIL", "pynng", "_cffi_backend", __name__ + ".cffi", __name__ + ".cbor")
 
 # global var to store the holoplay core instance
 hp = None
@@ -187,6 +188,16 @@ class looking_glass_panel(bpy.types.Panel):
 			max = 10000,
 			description = "Resolution of an individual view in Y",
 			)
+	bpy.types.WindowManager.singleOffscreen = bpy.props.BoolProperty(
+			name = "Single Offscreen Rendering",
+			default = False,
+			description = "Render all views through one offscreen buffer so memory usage does not grow with the number of views. Falls back to one offscreen per view when not supported.",
+			)
+	bpy.types.WindowManager.rawQuiltTransport = bpy.props.BoolProperty(
+			name = "Send Raw Quilts (Experimental)",
+			default = False,
+			description = "Send the quilt as raw pixels instead of encoding it as BMP. HoloPlay Service does not report whether it accepts raw quilts, a service that does not shows nothing.",
+			)
 	bpy.types.WindowManager.numDevicesConnected = bpy.props.IntProperty(
 			name = "Connected Devices",
 			default = 0,
@@ -199,7 +210,18 @@ class looking_glass_panel(bpy.types.Panel):
 	def draw(self, context):
 		wm = context.window_manager
 		layout = self.layout
-		if wm.numDevicesConnected < 1:
+		state = looking_glass_settings.connectionState
+		if looking_glass_settings.installStatus != None:
+			layout.label(text=looking_glass_settings.installStatus, icon='TIME')
+		elif looking_glass_settings.missingPackages:
+			text = "Missing Python packages: " + ", ".join(looking_glass_settings.missingPackages)
+			layout.label(text=text, icon='ERROR')
+			layout.operator("lookingglass.install_dependencies", text="Install Dependencies", icon='IMPORT')
+		elif state == "connecting":
+			layout.label(text="Connecting to HoloPlay Service...", icon='TIME')
+		elif state == "failed":
+			layout.label(text="Could not connect to HoloPlay Service.", icon='ERROR')
+		elif wm.numDevicesConnected < 1:
 			text="No connected LKG devices found."
 			layout.label(text=text, icon='ERROR')
 		else:
@@ -208,6 +230,19 @@ class looking_glass_panel(bpy.types.Panel):
 			text = "Device type: " + looking_glass_settings.hardwareVersion
 			layout.label(text=text)
 		layout.operator("lookingglass.reconnect_to_holoplay_service", text="Reconnect to Service", icon='PLUGIN')	
+		sender = looking_glass_settings.sender
+		if sender != None:
+			text = "Send queue: " + str(sender.queue_depth) + ", last latency: %.1f ms" % (sender.last_latency * 1000.0)
+			layout.label(text=text)
+		if looking_glass_settings.lastSendError != None:
+			layout.label(text="Last send failed: " + looking_glass_settings.lastSendError, icon='ERROR')
+		layout.prop(wm, "singleOffscreen")
+		layout.prop(wm, "rawQuiltTransport")
+		if wm.rawQuiltTransport:
+			layout.label(text="Raw quilts only show up if HoloPlay Service accepts them.", icon='ERROR')
+		stats = OffScreenDraw.offscreen_pool_stats()
+		text = "Offscreen pool: " + str(stats['offscreens']) + " buffers, " + str(stats['hits']) + " hits, " + str(stats['misses']) + " misses"
+		layout.label(text=text)
 
 classes = (
 	OffScreenDraw,
@@ -216,22 +251,39 @@ classes = (
 	looking_glass_render_viewer,
 	looking_glass_send_quilt_to_holoplay_service,
 	looking_glass_save_quilt_as_image,
-	looking_glass_reconnect_to_holoplay_service
+	looking_glass_reconnect_to_holoplay_service,
+	looking_glass_install_dependencies
 )
 
+def registration_report(register_time):
+	""" prints how long importing and registering took against REGISTRATION_BUDGET, and which heavy modules were loaded on the way """
+	total = _import_time + register_time
+	print("Registering the Looking Glass Toolset took %.1f ms (imports %.1f ms, register %.1f ms), budget %.1f ms" % (total * 1000.0, _import_time * 1000.0, register_time * 1000.0, REGISTRATION_BUDGET * 1000.0))
+	if total > REGISTRATION_BUDGET:
+		print("Registering the Looking Glass Toolset is over its budget")
+	loaded = [name for name in HEAVY_MODULES if name in sys.modules and name not in _modules_before_import]
+	if loaded:
+		print("Modules loaded while registering that should only be loaded when used: " + ", ".join(loaded))
+
 def register():
 	global hp
+	start_time = timeit.default_timer()
 	from bpy.utils import register_class
 	for cls in classes:
 		register_class(cls)
 	
-	looking_glass_settings.init()
+	# connecting to HoloPlay Service can take seconds, so it happens in the background once Blender is running.
+	# Persistent, as Blender drops the other timers when it loads a file, e.g. one given on the command line
+	bpy.app.timers.register(looking_glass_settings.init, first_interval=0.1, persistent=True)
 		
-	wm = bpy.context.window_manager
 	print("Registered the live view")
+	registration_report(timeit.default_timer() - start_time)
 
 def unregister():
 	from bpy.utils import unregister_class
+	OffScreenDraw.free_offscreen_pool()
+	looking_glass_settings.cancel_init()
+	looking_glass_settings.shutdown()
 	for cls in reversed(classes):
 		unregister_class(cls)
 	bpy.types.IMAGE_MT_view.remove(looking_glass_live_view.menu_func)
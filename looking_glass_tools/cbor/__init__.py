@@ -1,19 +1,69 @@
 #!python
 
-try:
-    # try C library _cbor.so
-    from ._cbor import loads, dumps, load, dump
-except:
-    # fall back to 100% python implementation
-    from .cbor import loads, dumps, load, dump
-
-from .cbor import Tag
-from .tagmap import TagMapper, ClassTag, UnknownTagException
+from . import cbor as _pure
+from .cbor import Tag, dumps_iov, iterload, Template, Slot
 from .VERSION import __doc__ as __version__
 
+# The module encoding and decoding goes through, the C accelerator built by
+# _cbor_build.py or the 100% python implementation. Every call looks it up
+# here, so use_accelerator() takes effect for code that imported the
+# functions below before it was called.
+_impl = _pure
+accelerated = False
+
+
+def use_accelerator():
+    """
+    Switch to the C accelerator if it has been built and loads, return whether it is in use.
+    Safe to call from any thread, calls already running finish with the implementation they started with.
+    """
+    global _impl
+    global accelerated
+    if not accelerated:
+        try:
+            from . import _cbor
+        except Exception:
+            return False
+        _impl = _cbor
+        accelerated = True
+    return True
+
+
+def loads(data, zero_copy=False, tag_hook=None):
+    """Same as cbor.cbor.loads(), accelerated when possible"""
+    return _impl.loads(data, zero_copy, tag_hook)
+
+
+def dumps(ob, sort_keys=False, hook=None):
+    """Same as cbor.cbor.dumps(), accelerated when possible"""
+    return _impl.dumps(ob, sort_keys, hook)
+
+
+def load(fp, tag_hook=None):
+    """Same as cbor.cbor.load()"""
+    return _impl.load(fp, tag_hook)
+
+
+def dump(obj, fp, sort_keys=False, hook=None):
+    """Same as cbor.cbor.dump(), accelerated when possible"""
+    return _impl.dump(obj, fp, sort_keys, hook)
+
+
+def _decode(data, pos=0, zero_copy=False, returntags=False, tag_hook=None):
+    # for the RPC clients, which decode items they found with cbor.cbor._item_end()
+    return _impl._decode(data, pos, zero_copy, returntags, tag_hook)
+
+
+use_accelerator()
+
+# tagmap encodes and decodes through the functions above
+from .tagmap import TagMapper, ClassTag, UnknownTagException
+
 __all__ = [
-    'loads', 'dumps', 'load', 'dump',
+    'loads', 'dumps', 'load', 'dump', 'dumps_iov', 'iterload',
     'Tag',
+    'Template', 'Slot',
     'TagMapper', 'ClassTag', 'UnknownTagException',
+    'use_accelerator',
     '__version__',
 ]
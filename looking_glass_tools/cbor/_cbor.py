@@ -0,0 +1,391 @@
+#!python
+# -*- Python -*-
+"""
+cbor codec using the C extension built by _cbor_build.py.
+
+Importing this module raises ImportError when the extension has not been built,
+and the package falls back to the pure Python implementation in cbor.py.
+The output of both is identical, check_parity() compares them on a corpus.
+"""
+
+import random
+from array import array
+
+from ._cbor_accel import ffi, lib
+from . import cbor as _pure
+from .cbor import CBOR_ARRAY, CBOR_MAP, Tag, tagify, _encode_type_num, _F_TOP, _F_ARRAY, _F_MAP, _F_TAG, _NO_KEY
+
+
+# token kinds written by cbor_scan()
+_T_UINT = 0
+_T_NEGINT = 1
+_T_BYTES = 2
+_T_TEXT = 3
+_T_ARRAY = 4
+_T_MAP = 5
+_T_TAG = 6
+_T_SIMPLE = 7
+_T_FLOAT = 8
+_T_BYTES_INDEF = 12
+_T_TEXT_INDEF = 13
+_T_ARRAY_INDEF = 14
+_T_MAP_INDEF = 15
+_T_BREAK = 16
+_T_FLOAT_ARRAY = 17
+_T_INT_ARRAY = 18
+
+_SIMPLE_VALUES = {20: False, 21: True, 22: None, 23: None}
+
+# below this many bytes the fixed cost of going through C is more than it saves
+_MIN_SCAN_SIZE = 1024
+# up to this many bytes the token arrays are sized for the worst case of one token
+# per byte, longer input is counted first
+_SCAN_CAPACITY = 16384
+
+# the token arrays are filled by cbor_scan(), clearing them first is wasted time
+_new_uncleared = ffi.new_allocator(should_clear_after_alloc=False)
+
+
+def loads(data, zero_copy=False, tag_hook=None):
+    """Same as cbor.loads()"""
+    if data is None:
+        raise ValueError("got None for buffer to decode in loads")
+    return _decode(data, zero_copy=zero_copy, tag_hook=tag_hook)[0]
+
+
+def load(fp, tag_hook=None):
+    """Same as cbor.load()"""
+    return _pure.load(fp, tag_hook=tag_hook)
+
+
+def _decode(data, pos=0, zero_copy=False, returntags=False, tag_hook=None, min_scan_size=_MIN_SCAN_SIZE):
+    """
+    Same as cbor._decode(), with the input checked and split into tokens in C.
+    Input shorter than min_scan_size is left to cbor._decode().
+    """
+    mv = memoryview(data)
+    if mv.ndim != 1 or mv.itemsize != 1:
+        mv = mv.cast('B')
+    end = len(mv)
+    if end - pos < min_scan_size:
+        return _pure._decode(data, pos, zero_copy, returntags, tag_hook)
+    try:
+        src = ffi.from_buffer('uint8_t[]', mv)
+    except (TypeError, ValueError):
+        return _pure._decode(data, pos, zero_copy, returntags, tag_hook)
+    counts = ffi.new('uint64_t[4]')
+    size = end - pos
+    nstr = nflt = nint = size
+    if size > _SCAN_CAPACITY:
+        size = lib.cbor_scan(src, end, pos, ffi.NULL, ffi.NULL, ffi.NULL, ffi.NULL, ffi.NULL, counts)
+        nstr = counts[1]
+        nflt = counts[2]
+        nint = counts[3]
+    if size > 0:
+        kinds_c = _new_uncleared('uint8_t[]', size)
+        vals_c = _new_uncleared('uint64_t[]', size)
+        offs_c = _new_uncleared('uint64_t[]', nstr or 1)
+        floats_c = _new_uncleared('double[]', nflt or 1)
+        ints_c = _new_uncleared('int64_t[]', nint or 1)
+        size = lib.cbor_scan(src, end, pos, kinds_c, vals_c, offs_c, floats_c, ints_c, counts)
+    if size <= 0:
+        # truncated, invalid or too deeply nested: the Python decoder raises the
+        # same exception as it does without the extension, or decodes deep nesting
+        return _pure._decode(data, pos, zero_copy, returntags, tag_hook)
+
+    kinds = ffi.unpack(kinds_c, size)
+    vals = ffi.unpack(vals_c, size)
+    offs = ffi.unpack(offs_c, counts[1])
+    floats = ffi.unpack(floats_c, counts[2])
+    ints = ffi.unpack(ints_c, counts[3])
+    pos = counts[0]
+    # indexing and slicing bytes is cheaper than going through the memoryview
+    buf = data if type(data) is bytes else mv
+    # next token, string offset, float and int
+    i = 0
+    si = 0
+    fi = 0
+    ii = 0
+    kind = _F_TOP
+    container = None
+    left = None
+    key = _NO_KEY
+    stack = []
+    while True:
+        tk = kinds[i]
+        aux = vals[i]
+        i += 1
+
+        if tk == _T_TEXT:
+            off = offs[si]
+            si += 1
+            value = str(buf[off:off + aux], 'utf8')
+        elif tk == _T_UINT:
+            value = aux
+        elif tk == _T_MAP or tk == _T_ARRAY:
+            if aux == 0:
+                value = {} if tk == _T_MAP else []
+            else:
+                stack.append((kind, container, left, key))
+                if tk == _T_MAP:
+                    kind = _F_MAP
+                    container = {}
+                else:
+                    kind = _F_ARRAY
+                    container = []
+                left = aux
+                key = _NO_KEY
+                continue
+        elif tk == _T_FLOAT:
+            value = floats[fi]
+            fi += 1
+        elif tk == _T_NEGINT:
+            value = -1 - aux
+        elif tk == _T_BYTES:
+            off = offs[si]
+            si += 1
+            if zero_copy:
+                value = mv[off:off + aux]
+            elif buf is data:
+                value = buf[off:off + aux]
+            else:
+                value = mv[off:off + aux].tobytes()
+        elif tk == _T_SIMPLE:
+            value = _SIMPLE_VALUES[aux]
+        elif tk == _T_TAG:
+            stack.append((kind, container, left, key))
+            kind = _F_TAG
+            container = aux
+            left = 1
+            continue
+        elif tk == _T_ARRAY_INDEF or tk == _T_MAP_INDEF:
+            stack.append((kind, container, left, key))
+            if tk == _T_MAP_INDEF:
+                kind = _F_MAP
+                container = {}
+            else:
+                kind = _F_ARRAY
+                container = []
+            left = None
+            key = _NO_KEY
+            continue
+        elif tk == _T_BREAK:
+            value = container
+            kind, container, left, key = stack.pop()
+        elif tk == _T_FLOAT_ARRAY:
+            value = floats[fi:fi + aux]
+            fi += aux
+        elif tk == _T_INT_ARRAY:
+            value = ints[ii:ii + aux]
+            ii += aux
+        else:
+            # indefinite length string, its chunks follow up to a break
+            chunks = []
+            while kinds[i] != _T_BREAK:
+                off = offs[si]
+                si += 1
+                chunks.append(mv[off:off + vals[i]])
+                i += 1
+            i += 1
+            value = b''.join(chunks)
+            if tk == _T_TEXT_INDEF:
+                value = value.decode('utf8')
+
+        # hand the value to the container being filled, closing every container that is complete
+        while True:
+            if kind == _F_MAP:
+                if key is _NO_KEY:
+                    # map keys have to be hashable, a view of a bytearray is not
+                    key = value.tobytes() if type(value) is memoryview else value
+                    break
+                container[key] = value
+                key = _NO_KEY
+            elif kind == _F_ARRAY:
+                container.append(value)
+            elif kind == _F_TAG:
+                if returntags:
+                    value = Tag(container, value)
+                elif tag_hook is not None:
+                    value = tag_hook(container, value)
+                else:
+                    value = tagify(value, container)
+                kind, container, left, key = stack.pop()
+                continue
+            else:
+                return value, pos
+            if left is None:
+                break
+            left -= 1
+            if left:
+                break
+            value = container
+            kind, container, left, key = stack.pop()
+
+
+# arrays shorter than this are not worth checking for plain numbers
+_MIN_NUMBER_ARRAY = 16
+
+
+def _dump_numbers(arr, write):
+    """Encode arr in C if it holds only floats or only ints that fit in an int64, return whether it did."""
+    types = set(map(type, arr))
+    if len(types) != 1:
+        return False
+    item_type = types.pop()
+    if item_type is float:
+        values = array('d', arr)
+        out = _new_uncleared('uint8_t[]', len(arr) * 9)
+        encoded = lib.cbor_encode_doubles(ffi.from_buffer('double[]', values), len(arr), out)
+    elif item_type is int:
+        try:
+            values = array('q', arr)
+        except OverflowError:
+            # bignums and uint64 beyond int64 take the Python path
+            return False
+        out = _new_uncleared('uint8_t[]', len(arr) * 9)
+        encoded = lib.cbor_encode_int64s(ffi.from_buffer('int64_t[]', values), len(arr), out)
+    else:
+        return False
+    write(_encode_type_num(CBOR_ARRAY, len(arr)))
+    write(ffi.buffer(out, encoded)[:])
+    return True
+
+
+def _dump_array(arr, write, sort_keys):
+    if len(arr) >= _MIN_NUMBER_ARRAY and _dump_numbers(arr, write):
+        return
+    write(_encode_type_num(CBOR_ARRAY, len(arr)))
+    encoders = _ENCODERS
+    for x in arr:
+        encode = encoders.get(type(x)) or _find_encoder(x)
+        encode(x, write, sort_keys)
+
+
+def _dump_dict(d, write, sort_keys):
+    write(_encode_type_num(CBOR_MAP, len(d)))
+    encoders = _ENCODERS
+    if sort_keys:
+        items = [(k, d[k]) for k in sorted(d.keys())]
+    else:
+        items = d.items()
+    for k,v in items:
+        encode = encoders.get(type(k)) or _find_encoder(k)
+        encode(k, write, sort_keys)
+        encode = encoders.get(type(v)) or _find_encoder(v)
+        encode(v, write, sort_keys)
+
+
+# the pure Python encoders, with arrays and the maps that may contain them replaced
+_ENCODERS = dict(_pure._ENCODERS)
+_ENCODERS[list] = _dump_array
+_ENCODERS[tuple] = _dump_array
+_ENCODERS[dict] = _dump_dict
+_REPLACED = {_pure._dump_array: _dump_array, _pure._dump_dict: _dump_dict}
+
+
+def _find_encoder(ob):
+    encode = _pure._find_encoder(ob)
+    encode = _REPLACED.get(encode, encode)
+    _ENCODERS[type(ob)] = encode
+    return encode
+
+
+def _dump(ob, write, sort_keys=False):
+    encode = _ENCODERS.get(type(ob)) or _find_encoder(ob)
+    encode(ob, write, sort_keys)
+
+
+def dumps(ob, sort_keys=False, hook=None):
+    """Same as cbor.dumps()"""
+    if hook is not None:
+        return _pure.dumps(ob, sort_keys, hook)
+    parts = []
+    _dump(ob, parts.append, sort_keys)
+    return b''.join(parts)
+
+
+def dump(obj, fp, sort_keys=False, hook=None):
+    """Same as cbor.dump()"""
+    if hook is not None:
+        return _pure.dump(obj, fp, sort_keys, hook)
+    _dump(obj, fp.write, sort_keys)
+
+
+def _random_item(rng, depth):
+    choice = rng.randrange(9 if depth > 0 else 6)
+    if choice == 0:
+        return rng.choice([0, 23, 24, 255, 256, 65535, 65536, 2**32, 2**63, 2**64 - 1, 2**64, -1, -24, -25, -2**63, -2**64, -2**64 - 1])
+    if choice == 1:
+        return rng.randrange(-2**40, 2**40)
+    if choice == 2:
+        return rng.choice([0.0, -0.0, 1.5, 1e300, float('inf'), rng.random()])
+    if choice == 3:
+        return u''.join(rng.choice(u'abü€\U0001f600') for _ in range(rng.randrange(40)))
+    if choice == 4:
+        return bytes(bytearray(rng.randrange(256) for _ in range(rng.randrange(300))))
+    if choice == 5:
+        return rng.choice([None, True, False])
+    if choice == 6:
+        return [_random_item(rng, depth - 1) for _ in range(rng.randrange(6))]
+    if choice == 7:
+        return [rng.random() for _ in range(rng.randrange(40))] if rng.random() < 0.5 else [rng.randrange(-2**62, 2**62) for _ in range(rng.randrange(40))]
+    return dict((u'k%d' % rng.randrange(100), _random_item(rng, depth - 1)) for _ in range(rng.randrange(6)))
+
+
+def _parity_corpus(count, seed):
+    rng = random.Random(seed)
+    corpus = [_random_item(rng, 4) for _ in range(count)]
+    corpus.append(Tag(99, [1, 2]))
+    corpus.extend([2**8000 + 12345, -2**8000 - 12345, [2**64 - 1, 2**64, -2**64, -2**64 - 1] * 5])
+    corpus.append([[[[[[[[[[[]]]]]]]]]]])
+    corpus.append({u'cmd': {u'show': {u'source': u'bindata'}}, u'bin': b'\0' * 70000})
+    return corpus
+
+
+# encodings that only the decoders see: other float widths, indefinite lengths and bad input
+_PARITY_BLOBS = [
+    b'\xf9\x3c\x00', b'\xf9\x7c\x00', b'\xf9\x00\x01', b'\xfa\x47\xc3\x50\x00', b'\xf7',
+    b'\x5f\x42\x01\x02\x43\x03\x04\x05\xff', b'\x7f\x65strea\x64ming\xff',
+    b'\x9f\x01\x82\x02\x03\x9f\x04\x05\xff\xff', b'\xbf\x61a\x01\x61b\x9f\x02\xff\xff',
+    b'\xc1\x1a\x51\x4b\x67\xb0', b'\xd8\x63\x82\x01\x02',
+    b'\x90' + b'\xf9\x3c\x00\xfa\x47\xc3\x50\x00' * 8, b'\x90' + b'\x01\x38\x63\x1b\x7f\xff\xff\xff\xff\xff\xff\xff\x3b\x80\0\0\0\0\0\0\0' * 4,
+    b'\x90' + b'\x01' * 15 + b'\xf9\x3c\x00', b'\x90' + b'\x01' * 15, b'\x90' + b'\x01' * 15 + b'\x19\x01',
+    b'', b'\x18', b'\x82\x01', b'\x62a', b'\x1c', b'\xf8\x20', b'\xff', b'\x9f\x01', b'\xbf\x01\xff',
+    b'\x5f\x61a\xff', b'\x7f\x41a\xff', b'\x5f\x5f\xff\xff', b'\x9b\xff\xff\xff\xff\xff\xff\xff\xff',
+]
+
+
+def _outcome(fn, *args, **kwargs):
+    try:
+        return ('ok', fn(*args, **kwargs))
+    except Exception as e:
+        return ('error', type(e))
+
+
+def check_parity(count=500, seed=1):
+    """
+    Encode and decode a generated corpus with both implementations, raise AssertionError
+    on the first difference. Returns the number of items checked.
+    """
+    corpus = _parity_corpus(count, seed)
+    checked = 0
+    for ob in corpus:
+        for sort_keys in (False, True):
+            encoded = _pure.dumps(ob, sort_keys=sort_keys)
+            assert dumps(ob, sort_keys=sort_keys) == encoded, repr(ob)[:200]
+        # valid input must not need the fallback to cbor._decode()
+        counts = ffi.new('uint64_t[4]')
+        assert lib.cbor_scan(encoded, len(encoded), 0, ffi.NULL, ffi.NULL, ffi.NULL, ffi.NULL, ffi.NULL, counts) > 0, repr(ob)[:200]
+        assert _outcome(_decode, encoded, min_scan_size=0) == _outcome(_pure._decode, encoded), repr(ob)[:200]
+        # every truncation has to fail the same way
+        for cut in set([0, 1, len(encoded) // 2, len(encoded) - 1]):
+            if cut < len(encoded):
+                assert _outcome(_decode, encoded[:cut], min_scan_size=0) == _outcome(_pure._decode, encoded[:cut]), repr(ob)[:200]
+        assert _decode(bytearray(encoded), min_scan_size=0)[0] == _pure.loads(encoded)
+        assert loads(encoded) == _pure.loads(encoded)
+        checked += 1
+    for blob in _PARITY_BLOBS:
+        assert _outcome(_decode, blob, min_scan_size=0) == _outcome(_pure._decode, blob), repr(blob)
+        assert _outcome(_decode, blob, returntags=True, min_scan_size=0) == _outcome(_pure._decode, blob, returntags=True), repr(blob)
+        checked += 1
+    return checked
@@ -0,0 +1,475 @@
+#!python
+# -*- Python -*-
+"""
+Builds _cbor_accel, the optional C part of the cbor package, with cffi.
+
+cffi cannot hand Python objects to C, so the C code works on buffers only:
+cbor_scan() checks one encoded item and lists its tokens in flat arrays that
+_cbor.py turns into Python objects, and the cbor_encode_* functions encode
+arrays of plain numbers. Everything else is shared with the pure Python
+implementation in cbor.py, which is used whenever the extension is missing.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+
+try:
+    # the copy of cffi bundled with the add-on
+    from ..cffi import FFI
+    from ..cffi.backend_ctypes import CTypesBackend
+except ImportError:
+    from cffi import FFI
+    from cffi.backend_ctypes import CTypesBackend
+
+
+MODULE_NAME = '_cbor_accel'
+
+CDEF = """
+#define CBOR_ERR_EOF ...
+#define CBOR_ERR_INVALID ...
+#define CBOR_ERR_DEPTH ...
+
+int64_t cbor_scan(const uint8_t *buf, size_t len, size_t pos,
+                  uint8_t *kinds, uint64_t *vals, uint64_t *offs, double *floats, int64_t *ints,
+                  uint64_t *counts);
+size_t cbor_encode_doubles(const double *vals, size_t n, uint8_t *out);
+size_t cbor_encode_int64s(const int64_t *vals, size_t n, uint8_t *out);
+"""
+
+SOURCE = r"""
+#include <stdint.h>
+#include <string.h>
+#include <math.h>
+
+#define CBOR_ERR_EOF (-1)
+#define CBOR_ERR_INVALID (-2)
+#define CBOR_ERR_DEPTH (-3)
+
+/* deeper documents are left to the pure Python decoder */
+#define CBOR_MAX_DEPTH 1024
+
+/* token kinds, must match the _T_* constants in _cbor.py */
+#define TOK_UINT 0
+#define TOK_NEGINT 1
+#define TOK_BYTES 2
+#define TOK_TEXT 3
+#define TOK_ARRAY 4
+#define TOK_MAP 5
+#define TOK_TAG 6
+#define TOK_SIMPLE 7
+#define TOK_FLOAT 8
+#define TOK_INDEF 10  /* + major type: 12 bytes, 13 text, 14 array, 15 map */
+#define TOK_BREAK 16
+#define TOK_FLOAT_ARRAY 17
+#define TOK_INT_ARRAY 18
+
+/* shorter arrays are not checked for being all numbers */
+#define CBOR_MIN_NUMBER_ARRAY 16
+
+typedef struct {
+    uint64_t left;   /* items still to come in a definite length container */
+    uint64_t count;  /* items seen in an indefinite length container */
+    int indef;
+    int is_map;
+} cbor_frame;
+
+static double cbor_half_to_double(unsigned int half)
+{
+    int exp = (half >> 10) & 0x1f;
+    unsigned int mant = half & 0x3ff;
+    double val;
+    if (exp == 0) {
+        val = ldexp((double)mant, -24);
+    } else if (exp != 31) {
+        val = ldexp((double)(mant + 1024), exp - 25);
+    } else {
+        val = (mant == 0) ? INFINITY : NAN;
+    }
+    return (half & 0x8000) ? -val : val;
+}
+
+static uint64_t cbor_read_be(const uint8_t *p, size_t n)
+{
+    uint64_t v = 0;
+    size_t i;
+    for (i = 0; i < n; i++) {
+        v = (v << 8) | p[i];
+    }
+    return v;
+}
+
+static double cbor_read_float(const uint8_t *p, unsigned int info)
+{
+    double d;
+    if (info == 25) {
+        d = cbor_half_to_double((unsigned int)cbor_read_be(p, 2));
+    } else if (info == 26) {
+        uint32_t bits = (uint32_t)cbor_read_be(p, 4);
+        float f;
+        memcpy(&f, &bits, 4);
+        d = f;
+    } else {
+        uint64_t bits = cbor_read_be(p, 8);
+        memcpy(&d, &bits, 8);
+    }
+    return d;
+}
+
+/*
+ * Whether the n items at buf[pos] are all floats (returns TOK_FLOAT_ARRAY) or all ints
+ * that fit in an int64_t (returns TOK_INT_ARRAY), anything else returns 0.
+ */
+static int cbor_number_run(const uint8_t *buf, size_t len, size_t pos, uint64_t n)
+{
+    uint64_t i;
+    unsigned int ib, info;
+    size_t size;
+    int run = 0;
+    for (i = 0; i < n; i++) {
+        if (pos >= len) {
+            return 0;
+        }
+        ib = buf[pos];
+        info = ib & 0x1f;
+        if (ib == 0xf9 || ib == 0xfa || ib == 0xfb) {
+            if (run == TOK_INT_ARRAY) {
+                return 0;
+            }
+            run = TOK_FLOAT_ARRAY;
+        } else if ((ib >> 5) <= 1 && info <= 27) {
+            if (run == TOK_FLOAT_ARRAY) {
+                return 0;
+            }
+            run = TOK_INT_ARRAY;
+        } else {
+            return 0;
+        }
+        size = (info < 24) ? 1 : 1 + ((size_t)1 << (info - 24));
+        if (len - pos < size) {
+            return 0;
+        }
+        if (info == 27 && (ib >> 5) <= 1 && (buf[pos + 1] & 0x80)) {
+            return 0;
+        }
+        pos += size;
+    }
+    return run;
+}
+
+/* argument of the initial byte, stored inline or in the 1, 2, 4 or 8 bytes after it */
+static int cbor_read_arg(const uint8_t *buf, size_t len, size_t *pos, unsigned int info, uint64_t *arg)
+{
+    size_t n;
+    if (info < 24) {
+        *arg = info;
+        return 0;
+    }
+    if (info > 27) {
+        return CBOR_ERR_INVALID;
+    }
+    n = (size_t)1 << (info - 24);
+    if (len - *pos < n) {
+        return CBOR_ERR_EOF;
+    }
+    *arg = cbor_read_be(buf + *pos, n);
+    *pos += n;
+    return 0;
+}
+
+/*
+ * Check the item starting at buf[pos] and list its tokens in order.
+ * kinds[i] and vals[i] are the kind and argument of token i. Byte and text strings
+ * (and the chunks of indefinite length ones) add their payload offset to offs,
+ * floats add their value to floats. An array of at least CBOR_MIN_NUMBER_ARRAY
+ * items that are all floats or all int64 is a single token, its values are added
+ * to floats or ints. With kinds NULL only counts. counts receives the position
+ * after the item and the number of offsets, floats and ints. Returns the number
+ * of tokens or a CBOR_ERR_* code.
+ */
+int64_t cbor_scan(const uint8_t *buf, size_t len, size_t pos,
+                  uint8_t *kinds, uint64_t *vals, uint64_t *offs, double *floats, int64_t *ints,
+                  uint64_t *counts)
+{
+    cbor_frame stack[CBOR_MAX_DEPTH];
+    int depth = 0;
+    int64_t ntok = 0;
+    uint64_t nstr = 0;
+    uint64_t nflt = 0;
+    uint64_t nint = 0;
+    unsigned int ib, major, info;
+    uint64_t arg;
+    int kind, complete, err, numbers;
+    cbor_frame *frame;
+
+#define EMIT(k, v) do { if (kinds) { kinds[ntok] = (uint8_t)(k); vals[ntok] = (v); } ntok++; } while (0)
+#define PUSH(l, ind, map) do { \
+        if (depth == CBOR_MAX_DEPTH) return CBOR_ERR_DEPTH; \
+        stack[depth].left = (l); stack[depth].count = 0; \
+        stack[depth].indef = (ind); stack[depth].is_map = (map); depth++; \
+    } while (0)
+
+    for (;;) {
+        if (pos >= len) {
+            return CBOR_ERR_EOF;
+        }
+        ib = buf[pos++];
+        major = ib >> 5;
+        info = ib & 0x1f;
+        complete = 1;
+
+        if (major == 7) {
+            if (info >= 20 && info <= 23) {
+                EMIT(TOK_SIMPLE, info);
+            } else if (info >= 25 && info <= 27) {
+                size_t n = (size_t)1 << (info - 24);
+                if (len - pos < n) {
+                    return CBOR_ERR_EOF;
+                }
+                if (floats) {
+                    floats[nflt] = cbor_read_float(buf + pos, info);
+                }
+                pos += n;
+                nflt++;
+                EMIT(TOK_FLOAT, 0);
+            } else if (info == 31) {
+                if (depth == 0 || !stack[depth - 1].indef) {
+                    return CBOR_ERR_INVALID;
+                }
+                if (stack[depth - 1].is_map && (stack[depth - 1].count & 1)) {
+                    return CBOR_ERR_INVALID;
+                }
+                EMIT(TOK_BREAK, 0);
+                depth--;
+            } else {
+                return CBOR_ERR_INVALID;
+            }
+        } else if (info == 31) {
+            if (major == 2 || major == 3) {
+                /* indefinite length string: definite chunks of the same type up to a break */
+                EMIT(TOK_INDEF + major, 0);
+                for (;;) {
+                    unsigned int chunk;
+                    if (pos >= len) {
+                        return CBOR_ERR_EOF;
+                    }
+                    chunk = buf[pos++];
+                    if (chunk == 0xff) {
+                        EMIT(TOK_BREAK, 0);
+                        break;
+                    }
+                    if ((chunk >> 5) != major || (chunk & 0x1f) == 31) {
+                        return CBOR_ERR_INVALID;
+                    }
+                    err = cbor_read_arg(buf, len, &pos, chunk & 0x1f, &arg);
+                    if (err) {
+                        return err;
+                    }
+                    if (len - pos < arg) {
+                        return CBOR_ERR_EOF;
+                    }
+                    if (offs) {
+                        offs[nstr] = pos;
+                    }
+                    nstr++;
+                    EMIT(major, arg);
+                    pos += (size_t)arg;
+                }
+            } else if (major == 4 || major == 5) {
+                EMIT(TOK_INDEF + major, 0);
+                PUSH(0, 1, major == 5);
+                complete = 0;
+            } else {
+                return CBOR_ERR_INVALID;
+            }
+        } else {
+            err = cbor_read_arg(buf, len, &pos, info, &arg);
+            if (err) {
+                return err;
+            }
+            kind = (int)major;
+            if (major == 2 || major == 3) {
+                if (len - pos < arg) {
+                    return CBOR_ERR_EOF;
+                }
+                if (offs) {
+                    offs[nstr] = pos;
+                }
+                nstr++;
+                pos += (size_t)arg;
+            } else if (major == 4 && arg >= CBOR_MIN_NUMBER_ARRAY &&
+                       (numbers = cbor_number_run(buf, len, pos, arg)) != 0) {
+                /* the whole array is one token, its numbers go to floats or ints */
+                uint64_t i;
+                kind = numbers;
+                for (i = 0; i < arg; i++) {
+                    ib = buf[pos++];
+                    info = ib & 0x1f;
+                    if (numbers == TOK_FLOAT_ARRAY) {
+                        if (floats) {
+                            floats[nflt] = cbor_read_float(buf + pos, info);
+                        }
+                        nflt++;
+                        pos += (size_t)1 << (info - 24);
+                    } else {
+                        uint64_t v = 0;
+                        cbor_read_arg(buf, len, &pos, info, &v);
+                        if (ints) {
+                            ints[nint] = (ib >> 5) ? -1 - (int64_t)v : (int64_t)v;
+                        }
+                        nint++;
+                    }
+                }
+            } else if (major == 4 || major == 5) {
+                if (arg != 0) {
+                    /* every item takes at least one byte */
+                    if (arg > len - pos || (major == 5 && arg > (len - pos) / 2)) {
+                        return CBOR_ERR_EOF;
+                    }
+                    PUSH(major == 5 ? arg * 2 : arg, 0, major == 5);
+                    complete = 0;
+                }
+            } else if (major == 6) {
+                PUSH(1, 0, 0);
+                complete = 0;
+            }
+            EMIT(kind, arg);
+        }
+
+        /* a complete item fills a slot of its container, which may complete that too */
+        while (complete) {
+            if (depth == 0) {
+                counts[0] = pos;
+                counts[1] = nstr;
+                counts[2] = nflt;
+                counts[3] = nint;
+                return ntok;
+            }
+            frame = &stack[depth - 1];
+            if (frame->indef) {
+                frame->count++;
+                break;
+            }
+            if (--frame->left) {
+                break;
+            }
+            depth--;
+        }
+    }
+#undef EMIT
+#undef PUSH
+}
+
+/* n CBOR doubles, 9 bytes each */
+size_t cbor_encode_doubles(const double *vals, size_t n, uint8_t *out)
+{
+    size_t i;
+    int b;
+    uint64_t bits;
+    uint8_t *p = out;
+    for (i = 0; i < n; i++) {
+        memcpy(&bits, &vals[i], 8);
+        *p++ = 0xfb;
+        for (b = 56; b >= 0; b -= 8) {
+            *p++ = (uint8_t)(bits >> b);
+        }
+    }
+    return (size_t)(p - out);
+}
+
+/* n CBOR ints in their shortest form, at most 9 bytes each */
+size_t cbor_encode_int64s(const int64_t *vals, size_t n, uint8_t *out)
+{
+    size_t i;
+    int b, nbytes;
+    uint64_t v;
+    uint8_t major;
+    uint8_t *p = out;
+    for (i = 0; i < n; i++) {
+        if (vals[i] >= 0) {
+            major = 0x00;
+            v = (uint64_t)vals[i];
+        } else {
+            major = 0x20;
+            v = (uint64_t)(-1 - vals[i]);
+        }
+        if (v <= 23) {
+            *p++ = (uint8_t)(major | v);
+            continue;
+        }
+        if (v <= 0xff) {
+            *p++ = major | 24;
+            nbytes = 1;
+        } else if (v <= 0xffff) {
+            *p++ = major | 25;
+            nbytes = 2;
+        } else if (v <= 0xffffffffu) {
+            *p++ = major | 26;
+            nbytes = 4;
+        } else {
+            *p++ = major | 27;
+            nbytes = 8;
+        }
+        for (b = (nbytes - 1) * 8; b >= 0; b -= 8) {
+            *p++ = (uint8_t)(v >> b);
+        }
+    }
+    return (size_t)(p - out);
+}
+"""
+
+
+def _make_ffi():
+    try:
+        return FFI()
+    except Exception:
+        # no _cffi_backend, or one of another version than the bundled cffi. Generating
+        # the C source does not need it, the built module uses whichever is installed.
+        return FFI(backend=CTypesBackend())
+
+
+def extension_path():
+    """Path of the built extension in the cbor package, or None."""
+    from importlib.machinery import EXTENSION_SUFFIXES
+    here = os.path.dirname(os.path.abspath(__file__))
+    for suffix in EXTENSION_SUFFIXES:
+        path = os.path.join(here, MODULE_NAME + suffix)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def have_compiler():
+    """Cheap check for a C compiler, so the build is not tried where it cannot work."""
+    if sys.platform == 'win32':
+        vswhere = os.path.join(os.environ.get('ProgramFiles(x86)', r'C:\Program Files (x86)'),
+                               'Microsoft Visual Studio', 'Installer', 'vswhere.exe')
+        return os.path.exists(vswhere) or shutil.which('cl') is not None
+    compilers = [os.environ.get('CC', '').split(' ')[0], 'cc', 'gcc', 'clang']
+    return any(shutil.which(cc) for cc in compilers if cc)
+
+
+def build(verbose=False):
+    """
+    Compile _cbor_accel into the cbor package, return the path of the extension.
+    Raises whatever cffi or the compiler raise when that is not possible.
+    """
+    ffi = _make_ffi()
+    ffi.cdef(CDEF)
+    libraries = [] if sys.platform == 'win32' else ['m']
+    ffi.set_source(MODULE_NAME, SOURCE, libraries=libraries)
+    here = os.path.dirname(os.path.abspath(__file__))
+    # build in a scratch directory so only the extension ends up next to the sources
+    tmpdir = tempfile.mkdtemp(prefix='cbor_build_')
+    try:
+        built = ffi.compile(tmpdir=tmpdir, verbose=verbose)
+        target = os.path.join(here, os.path.basename(built))
+        shutil.copy(built, target)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return target
+
+
+if __name__ == '__main__':
+    print(build(verbose=True))
@@ -65,70 +65,88 @@ CBOR_TAG_REGEX = 35
 CBOR_TAG_MIME = 36 # following text is MIME message, headers, separators and all
 CBOR_TAG_CBOR_FILEHEADER = 55799 # can open a file with 0xd9d9f7
 
-_CBOR_TAG_BIGNUM_BYTES = struct.pack('B', CBOR_TAG | CBOR_TAG_BIGNUM)
+# struct formats used by the encoder, compiled once
+_STRUCT_B = struct.Struct('B')
+_STRUCT_BB = struct.Struct('BB')
+_STRUCT_BH = struct.Struct('!BH')
+_STRUCT_BI = struct.Struct('!BI')
+_STRUCT_BQ = struct.Struct('!BQ')
+_STRUCT_BD = struct.Struct('!Bd')
 
+# every single byte value, for initial bytes that carry their argument (0..23) inline
+_BYTES = tuple(_STRUCT_B.pack(i) for i in range(256))
 
-def dumps_int(val):
-    "return bytes representing int val in CBOR"
+_CBOR_TAG_BIGNUM_BYTES = _BYTES[CBOR_TAG | CBOR_TAG_BIGNUM]
+_CBOR_TAG_NEGBIGNUM_BYTES = _BYTES[CBOR_TAG | CBOR_TAG_NEGBIGNUM]
+
+
+def _dumps_int(val):
     if val >= 0:
         # CBOR_UINT is 0, so I'm lazy/efficient about not OR-ing it in.
         if val <= 23:
-            return struct.pack('B', val)
+            return _BYTES[val]
         if val <= 0x0ff:
-            return struct.pack('BB', CBOR_UINT8_FOLLOWS, val)
+            return _STRUCT_BB.pack(CBOR_UINT8_FOLLOWS, val)
         if val <= 0x0ffff:
-            return struct.pack('!BH', CBOR_UINT16_FOLLOWS, val)
+            return _STRUCT_BH.pack(CBOR_UINT16_FOLLOWS, val)
         if val <= 0x0ffffffff:
-            return struct.pack('!BI', CBOR_UINT32_FOLLOWS, val)
+            return _STRUCT_BI.pack(CBOR_UINT32_FOLLOWS, val)
         if val <= 0x0ffffffffffffffff:
-            return struct.pack('!BQ', CBOR_UINT64_FOLLOWS, val)
+            return _STRUCT_BQ.pack(CBOR_UINT64_FOLLOWS, val)
         outb = _dumps_bignum_to_bytearray(val)
         return _CBOR_TAG_BIGNUM_BYTES + _encode_type_num(CBOR_BYTES, len(outb)) + outb
+    # a negative integer or negative bignum holds -1 - val, so -2**64 still fits in 64 bits
     val = -1 - val
-    return _encode_type_num(CBOR_NEGINT, val)
+    if val <= 0x0ffffffffffffffff:
+        return _encode_type_num(CBOR_NEGINT, val)
+    outb = _dumps_bignum_to_bytearray(val)
+    return _CBOR_TAG_NEGBIGNUM_BYTES + _encode_type_num(CBOR_BYTES, len(outb)) + outb
+
+
+def dumps_int(val):
+    "return bytes representing int val in CBOR"
+    encoded = _INT_CACHE.get(val)
+    if encoded is None:
+        encoded = _dumps_int(val)
+    return encoded
 
 
 if _IS_PY3:
     def _dumps_bignum_to_bytearray(val):
-        out = []
-        while val > 0:
-            out.insert(0, val & 0x0ff)
-            val = val >> 8
-        return bytes(out)
+        return val.to_bytes((val.bit_length() + 7) // 8, 'big')
 else:
+    import binascii
+
     def _dumps_bignum_to_bytearray(val):
-        out = []
-        while val > 0:
-            out.insert(0, chr(val & 0x0ff))
-            val = val >> 8
-        return b''.join(out)
+        # hex digits map to bytes directly, so this stays linear in the size of val
+        digits = '%x' % val
+        if len(digits) % 2:
+            digits = '0' + digits
+        return binascii.unhexlify(digits)
 
 
 def dumps_float(val):
-    return struct.pack("!Bd", CBOR_FLOAT64, val)
-
-
-_CBOR_TAG_NEGBIGNUM_BYTES = struct.pack('B', CBOR_TAG | CBOR_TAG_NEGBIGNUM)
+    return _STRUCT_BD.pack(CBOR_FLOAT64, val)
 
 
 def _encode_type_num(cbor_type, val):
     """For some CBOR primary type [0..7] and an auxiliary unsigned number, return CBOR encoded bytes"""
     assert val >= 0
     if val <= 23:
-        return struct.pack('B', cbor_type | val)
+        return _BYTES[cbor_type | val]
     if val <= 0x0ff:
-        return struct.pack('BB', cbor_type | CBOR_UINT8_FOLLOWS, val)
+        return _STRUCT_BB.pack(cbor_type | CBOR_UINT8_FOLLOWS, val)
     if val <= 0x0ffff:
-        return struct.pack('!BH', cbor_type | CBOR_UINT16_FOLLOWS, val)
+        return _STRUCT_BH.pack(cbor_type | CBOR_UINT16_FOLLOWS, val)
     if val <= 0x0ffffffff:
-        return struct.pack('!BI', cbor_type | CBOR_UINT32_FOLLOWS, val)
-    if (((cbor_type == CBOR_NEGINT) and (val <= 0x07fffffffffffffff)) or
-        ((cbor_type != CBOR_NEGINT) and (val <= 0x0ffffffffffffffff))):
-        return struct.pack('!BQ', cbor_type | CBOR_UINT64_FOLLOWS, val)
-    if cbor_type != CBOR_NEGINT:
-        raise Exception("value too big for CBOR unsigned number: {0!r}".format(val))
-    outb = _dumps_bignum_to_bytearray(val)
-    return _CBOR_TAG_NEGBIGNUM_BYTES + _encode_type_num(CBOR_BYTES, len(outb)) + outb
+        return _STRUCT_BI.pack(cbor_type | CBOR_UINT32_FOLLOWS, val)
+    if val <= 0x0ffffffffffffffff:
+        return _STRUCT_BQ.pack(cbor_type | CBOR_UINT64_FOLLOWS, val)
+    raise Exception("value too big for CBOR unsigned number: {0!r}".format(val))
+
+
+# encodings of the ints that turn up most (counts, sizes, small settings values)
+_INT_CACHE = dict((i, _dumps_int(i)) for i in range(-256, 1024))
 
 
 if _IS_PY3:
@@ -150,94 +168,342 @@ def dumps_string(val, is_text=None, is_bytes=None):
 
 
 def dumps_array(arr, sort_keys=False):
-    head = _encode_type_num(CBOR_ARRAY, len(arr))
-    parts = [dumps(x, sort_keys=sort_keys) for x in arr]
-    return head + b''.join(parts)
+    parts = []
+    _dump_array(arr, parts.append, sort_keys)
+    return b''.join(parts)
 
 
-if _IS_PY3:
-    def dumps_dict(d, sort_keys=False):
-        head = _encode_type_num(CBOR_MAP, len(d))
-        parts = [head]
-        if sort_keys:
-            for k in sorted(d.keys()):
-                v = d[k]
-                parts.append(dumps(k, sort_keys=sort_keys))
-                parts.append(dumps(v, sort_keys=sort_keys))
-        else:
-            for k,v in d.items():
-                parts.append(dumps(k, sort_keys=sort_keys))
-                parts.append(dumps(v, sort_keys=sort_keys))
-        return b''.join(parts)
-else:
-    def dumps_dict(d, sort_keys=False):
-        head = _encode_type_num(CBOR_MAP, len(d))
-        parts = [head]
-        if sort_keys:
-            for k in sorted(d.iterkeys()):
-                v = d[k]
-                parts.append(dumps(k, sort_keys=sort_keys))
-                parts.append(dumps(v, sort_keys=sort_keys))
-        else:
-            for k,v in d.iteritems():
-                parts.append(dumps(k, sort_keys=sort_keys))
-                parts.append(dumps(v, sort_keys=sort_keys))
-        return b''.join(parts)
+def dumps_dict(d, sort_keys=False):
+    parts = []
+    _dump_dict(d, parts.append, sort_keys)
+    return b''.join(parts)
 
 
 def dumps_bool(b):
     if b:
-        return struct.pack('B', CBOR_TRUE)
-    return struct.pack('B', CBOR_FALSE)
+        return _BYTES[CBOR_TRUE]
+    return _BYTES[CBOR_FALSE]
 
 
 def dumps_tag(t, sort_keys=False):
     return _encode_type_num(CBOR_TAG, t.tag) + dumps(t.value, sort_keys=sort_keys)
-    
 
+
+# Encoded text strings are kept for short strings, which are mostly map keys and
+# enum-like values ('cmd', 'settings', 'bindata', ...) that are sent over and over.
+_TEXT_CACHE = {}
+_TEXT_CACHE_MAX_LEN = 32
+_TEXT_CACHE_SIZE = 1024
+
+
+def _dump_text(val, write, sort_keys):
+    encoded = _TEXT_CACHE.get(val)
+    if encoded is None:
+        utf8 = val.encode('utf8')
+        encoded = _encode_type_num(CBOR_TEXT, len(utf8)) + utf8
+        if len(utf8) <= _TEXT_CACHE_MAX_LEN and len(_TEXT_CACHE) < _TEXT_CACHE_SIZE:
+            _TEXT_CACHE[val] = encoded
+    write(encoded)
+
+
+def _dump_bytes(val, write, sort_keys):
+    if type(val) is memoryview and (val.ndim != 1 or val.itemsize != 1):
+        val = val.cast('B')
+    # the payload is handed on as is, it is never copied into a new bytes object here
+    write(_encode_type_num(CBOR_BYTES, len(val)))
+    write(val)
+
+
+def _dump_string(val, write):
+    if _is_unicode(val):
+        _dump_text(val, write, False)
+    else:
+        _dump_bytes(val, write, False)
+
+
+def _dump_array(arr, write, sort_keys):
+    write(_encode_type_num(CBOR_ARRAY, len(arr)))
+    encoders = _ENCODERS
+    for x in arr:
+        encode = encoders.get(type(x)) or _find_encoder(x)
+        encode(x, write, sort_keys)
+
+
+def _dump_dict(d, write, sort_keys):
+    write(_encode_type_num(CBOR_MAP, len(d)))
+    encoders = _ENCODERS
+    if sort_keys:
+        items = [(k, d[k]) for k in sorted(d.keys())]
+    else:
+        items = d.items()
+    for k,v in items:
+        encode = encoders.get(type(k)) or _find_encoder(k)
+        encode(k, write, sort_keys)
+        encode = encoders.get(type(v)) or _find_encoder(v)
+        encode(v, write, sort_keys)
+
+
+def _dump_var_array(ob, write, sort_keys):
+    """Any other iterable, generators included, as an indefinite length array written item by item."""
+    write(_BYTES[CBOR_ARRAY | CBOR_VAR_FOLLOWS])
+    for x in ob:
+        _dump(x, write, sort_keys)
+    write(_BYTES[CBOR_BREAK])
+
+
+def _dump_var_map(ob, write, sort_keys):
+    """Any other mapping with items() as an indefinite length map written pair by pair."""
+    write(_BYTES[CBOR_MAP | CBOR_VAR_FOLLOWS])
+    items = ob.items()
+    if sort_keys:
+        items = sorted(items, key=lambda kv: kv[0])
+    for k,v in items:
+        _dump(k, write, sort_keys)
+        _dump(v, write, sort_keys)
+    write(_BYTES[CBOR_BREAK])
+
+
+def _dump_none(ob, write, sort_keys):
+    write(_BYTES[CBOR_NULL])
+
+
+def _dump_bool(ob, write, sort_keys):
+    write(_BYTES[CBOR_TRUE] if ob else _BYTES[CBOR_FALSE])
+
+
+def _dump_int(ob, write, sort_keys):
+    encoded = _INT_CACHE.get(ob)
+    if encoded is None:
+        encoded = _dumps_int(ob)
+    write(encoded)
+
+
+def _dump_float(ob, write, sort_keys):
+    write(_STRUCT_BD.pack(CBOR_FLOAT64, ob))
+
+
+def _dump_tag(ob, write, sort_keys):
+    write(_encode_type_num(CBOR_TAG, ob.tag))
+    _dump(ob.value, write, sort_keys)
+
+
+def _dump_slot(ob, write, sort_keys):
+    # only while compiling a Template, which splits its chunks at the slots
+    write(ob)
+
+
+def _dump_template_object(ob, write, sort_keys):
+    ob.template._dump_values(ob.values, write)
+
+
+# type(ob) -> function(ob, write, sort_keys). Types not listed here are looked up
+# through their base classes by _find_encoder() and then added, other mappings
+# and iterables are streamed as indefinite length maps and arrays.
+_ENCODERS = {
+    type(None): _dump_none,
+    bool: _dump_bool,
+    int: _dump_int,
+    float: _dump_float,
+    bytes: _dump_bytes,
+    bytearray: _dump_bytes,
+    memoryview: _dump_bytes,
+    list: _dump_array,
+    tuple: _dump_array,
+    dict: _dump_dict,
+}
 if _IS_PY3:
-    def _is_stringish(x):
-        return isinstance(x, (str, bytes))
-    def _is_intish(x):
-        return isinstance(x, int)
+    _ENCODERS[str] = _dump_text
 else:
-    def _is_stringish(x):
-        return isinstance(x, (str, basestring, bytes, unicode))
-    def _is_intish(x):
-        return isinstance(x, (int, long))
-
-
-def dumps(ob, sort_keys=False):
-    if ob is None:
-        return struct.pack('B', CBOR_NULL)
-    if isinstance(ob, bool):
-        return dumps_bool(ob)
-    if _is_stringish(ob):
-        return dumps_string(ob)
-    if isinstance(ob, (list, tuple)):
-        return dumps_array(ob, sort_keys=sort_keys)
-    # TODO: accept other enumerables and emit a variable length array
-    if isinstance(ob, dict):
-        return dumps_dict(ob, sort_keys=sort_keys)
-    if isinstance(ob, float):
-        return dumps_float(ob)
-    if _is_intish(ob):
-        return dumps_int(ob)
-    if isinstance(ob, Tag):
-        return dumps_tag(ob, sort_keys=sort_keys)
-    raise Exception("don't know how to cbor serialize object of type %s", type(ob))
-
-
-# same basic signature as json.dump, but with no options (yet)
-def dump(obj, fp, sort_keys=False):
+    _ENCODERS[unicode] = _dump_text
+    _ENCODERS[long] = _dump_int
+
+
+def _find_encoder(ob):
+    """Encoder for a type that is not in _ENCODERS yet, from the closest base class that is."""
+    cls = type(ob)
+    for base in cls.__mro__[1:]:
+        encode = _ENCODERS.get(base)
+        if encode is not None:
+            break
+    else:
+        if hasattr(cls, 'items'):
+            encode = _dump_var_map
+        elif hasattr(cls, '__iter__'):
+            encode = _dump_var_array
+        else:
+            raise Exception("don't know how to cbor serialize object of type %s", cls)
+    _ENCODERS[cls] = encode
+    return encode
+
+
+def _dump(ob, write, sort_keys=False):
+    """Encode ob by calling write() with each piece of CBOR in order.
+    Byte string payloads are passed to write() as the original object."""
+    encode = _ENCODERS.get(type(ob)) or _find_encoder(ob)
+    encode(ob, write, sort_keys)
+
+
+def _dump_hooked(ob, write, sort_keys, hook):
+    """_dump() that lets hook(value) replace every value, and every value inside lists, tuples
+    and dicts (but not dict keys), before it is encoded. What hook returns is encoded as is."""
+    ob = hook(ob)
+    if isinstance(ob, (list, tuple)) and type(ob) is not TemplateList:
+        write(_encode_type_num(CBOR_ARRAY, len(ob)))
+        for x in ob:
+            _dump_hooked(x, write, sort_keys, hook)
+    elif isinstance(ob, dict) and type(ob) is not TemplateObject:
+        write(_encode_type_num(CBOR_MAP, len(ob)))
+        if sort_keys:
+            items = [(k, ob[k]) for k in sorted(ob.keys())]
+        else:
+            items = ob.items()
+        for k,v in items:
+            _dump(k, write, sort_keys)
+            _dump_hooked(v, write, sort_keys, hook)
+    else:
+        _dump(ob, write, sort_keys)
+
+
+def dumps(ob, sort_keys=False, hook=None):
+    """
+    Serialize ob to CBOR bytes.
+    hook: optional function called with each value, returning it or the object to encode
+      in its place, e.g. a Tag. TagMapper uses this to tag objects while they are encoded.
+    """
+    parts = []
+    if hook is None:
+        _dump(ob, parts.append, sort_keys)
+    else:
+        _dump_hooked(ob, parts.append, sort_keys, hook)
+    return b''.join(parts)
+
+
+def dumps_iov(ob, sort_keys=False):
+    """
+    Serialize ob to a list of buffers whose concatenation is the CBOR encoding,
+    suitable for socket.sendmsg() or os.writev().
+    Byte strings (bytes, bytearray, memoryview) are included as they are, so large
+    payloads are not copied. They must not be modified until the buffers are written.
+    """
+    parts = []
+    _dump(ob, parts.append, sort_keys)
+    return parts
+
+
+# same basic signature as json.dump
+def dump(obj, fp, sort_keys=False, hook=None):
     """
     obj: Python object to serialize
     fp: file-like object capable of .write(bytes)
+    hook: as for dumps()
+
+    Each piece is written as soon as it is encoded, byte string payloads are
+    written directly from the object passed in. Generators and other iterables
+    are written as indefinite length arrays while they are iterated.
+    """
+    if hook is None:
+        _dump(obj, fp.write, sort_keys)
+    else:
+        _dump_hooked(obj, fp.write, sort_keys, hook)
+
+
+class Slot(object):
+    """Placeholder in the shape of a Template for a value given when encoding."""
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return "Slot({0!r})".format(self.name)
+
+
+class Template(object):
+    """
+    Pre-encoded CBOR for messages that always have the same shape.
+
+    shape: dict (or list) of primitives and containers with Slot placeholders.
+    Everything except the slots is encoded once, when the template is created.
+    Encoding a filled template writes the stored chunks and encodes only the
+    slot values, so the cost is a constant plus the cost of the values.
+
+    >>> t = Template({'cmd': {'show': {'name': Slot('name')}}, 'bin': Slot('bin')})
+    >>> dumps(t.fill(name='a', bin=b'xyz')) == dumps({'cmd': {'show': {'name': 'a'}}, 'bin': b'xyz'})
+    True
+    """
+    def __init__(self, shape, sort_keys=False):
+        if not isinstance(shape, (dict, list, tuple)):
+            raise TypeError("template shape must be a dict or list, got {0!r}".format(type(shape)))
+        self.shape = shape
+        self.sort_keys = sort_keys
+        pieces = []
+        _dump(shape, pieces.append, sort_keys)
+        # merge the encoded pieces between two slots into one chunk
+        self._chunks = []
+        static = []
+        for piece in pieces:
+            if isinstance(piece, Slot):
+                if static:
+                    self._chunks.append(b''.join(static))
+                    static = []
+                self._chunks.append(piece)
+            else:
+                static.append(piece)
+        if static:
+            self._chunks.append(b''.join(static))
+        self.slot_names = set(chunk.name for chunk in self._chunks if isinstance(chunk, Slot))
+        self._build = _compile_shape(shape)
+
+    def fill(self, **values):
+        """Return a TemplateObject (or TemplateList for a list shape), a dict that dumps() encodes through this template."""
+        missing = self.slot_names.difference(values)
+        if missing:
+            raise KeyError("missing template values: {0}".format(', '.join(sorted(missing))))
+        if isinstance(self.shape, dict):
+            return TemplateObject(self, values)
+        return TemplateList(self, values)
+
+    def dumps(self, **values):
+        return dumps(self.fill(**values))
+
+    def _dump_values(self, values, write):
+        for chunk in self._chunks:
+            if type(chunk) is bytes:
+                write(chunk)
+            else:
+                _dump(values[chunk.name], write, self.sort_keys)
+
+
+def _compile_shape(shape):
+    """Return a function that builds a copy of shape with the Slot values filled in."""
+    if isinstance(shape, Slot):
+        name = shape.name
+        return lambda values: values[name]
+    if isinstance(shape, dict):
+        items = [(k, _compile_shape(v)) for k, v in shape.items()]
+        return lambda values: dict([(k, build(values)) for k, build in items])
+    if isinstance(shape, (list, tuple)):
+        builds = [_compile_shape(v) for v in shape]
+        return lambda values: [build(values) for build in builds]
+    return lambda values: shape
+
+
+class TemplateObject(dict):
     """
-    # this is kinda lame, but probably not inefficient for non-huge objects
-    # TODO: .write() to fp as we go as each inner object is serialized
-    blob = dumps(obj, sort_keys=sort_keys)
-    fp.write(blob)
+    The shape of a Template with the slot values filled in. It can be read like the
+    plain dict it stands for, but dumps() encodes it from the pre-encoded template,
+    so changes made to it are not encoded.
+    """
+    def __init__(self, template, values):
+        super(TemplateObject, self).__init__(template._build(values))
+        self.template = template
+        self.values = values
+
+
+class TemplateList(list):
+    """TemplateObject of a Template whose shape is a list."""
+    def __init__(self, template, values):
+        super(TemplateList, self).__init__(template._build(values))
+        self.template = template
+        self.values = values
 
 
 class Tag(object):
@@ -254,23 +520,339 @@ class Tag(object):
         return (self.tag == other.tag) and (self.value == other.value)
 
 
-def loads(data):
+_ENCODERS[Slot] = _dump_slot
+_ENCODERS[TemplateObject] = _dump_template_object
+_ENCODERS[TemplateList] = _dump_template_object
+_ENCODERS[Tag] = _dump_tag
+
+
+def loads(data, zero_copy=False, tag_hook=None):
     """
     Parse CBOR bytes and return Python objects.
+
+    data: bytes, bytearray, memoryview or any other object supporting the buffer protocol
+    zero_copy: return byte strings as memoryview slices of data instead of copying them
+      into new bytes objects. The slices keep data alive and see any change made to it
+      later, and a bytearray cannot be resized while slices of it exist. Call .tobytes()
+      on a slice that has to outlive or be independent of data. Indefinite length byte
+      strings are made of several chunks and are still joined into a new bytes object,
+      and byte string map keys are copied as well.
+    tag_hook: optional function called as tag_hook(tag number, decoded value) for every
+      tagged item, returning the object that stands for it. By default tagify() decodes
+      the tags it knows and returns a Tag for the others.
     """
     if data is None:
         raise ValueError("got None for buffer to decode in loads")
+    if _IS_PY3:
+        return _decode(data, zero_copy=zero_copy, tag_hook=tag_hook)[0]
+    # the stream decoder always copies
     fp = StringIO(data)
-    return _loads(fp)[0]
+    return _loads(fp, tag_hook=tag_hook)[0]
 
 
-def load(fp):
+def load(fp, tag_hook=None):
     """
     Parse and return object from fp, a file-like object supporting .read(n)
+    tag_hook: as for loads()
+    """
+    return _loads(fp, tag_hook=tag_hook)[0]
+
+
+# Buffer decoder used by loads(). It works on a memoryview with an offset
+# cursor, looks every initial byte up in a 256 entry table and keeps the
+# containers being filled on an explicit stack instead of recursing.
+
+_D_UINT = 0
+_D_NEGINT = 1
+_D_BYTES = 2
+_D_TEXT = 3
+_D_ARRAY = 4
+_D_MAP = 5
+_D_TAG = 6
+_D_SIMPLE = 7
+_D_FLOAT = 8
+_D_BREAK = 9
+_D_INVALID = 10
+
+_MAJOR_ACTIONS = {
+    CBOR_UINT: _D_UINT,
+    CBOR_NEGINT: _D_NEGINT,
+    CBOR_BYTES: _D_BYTES,
+    CBOR_TEXT: _D_TEXT,
+    CBOR_ARRAY: _D_ARRAY,
+    CBOR_MAP: _D_MAP,
+    CBOR_TAG: _D_TAG,
+}
+
+_AUX_STRUCTS = {
+    CBOR_UINT8_FOLLOWS: struct.Struct('!B'),
+    CBOR_UINT16_FOLLOWS: struct.Struct('!H'),
+    CBOR_UINT32_FOLLOWS: struct.Struct('!I'),
+    CBOR_UINT64_FOLLOWS: struct.Struct('!Q'),
+}
+
+_SIMPLE_VALUES = {
+    CBOR_FALSE: False,
+    CBOR_TRUE: True,
+    CBOR_NULL: None,
+    CBOR_UNDEFINED: None,
+}
+
+
+def _build_initial_byte_table():
+    """
+    For every initial byte: (action, immediate value, number of argument bytes, struct for them).
+    An immediate value of None with no argument bytes means indefinite length.
+    """
+    table = []
+    for ib in range(256):
+        major = ib & CBOR_TYPE_MASK
+        info = ib & CBOR_INFO_BITS
+        if major == CBOR_7:
+            if ib in _SIMPLE_VALUES:
+                table.append((_D_SIMPLE, _SIMPLE_VALUES[ib], 0, None))
+            elif ib == CBOR_FLOAT16:
+                table.append((_D_FLOAT, None, 2, struct.Struct('!e')))
+            elif ib == CBOR_FLOAT32:
+                table.append((_D_FLOAT, None, 4, struct.Struct('!f')))
+            elif ib == CBOR_FLOAT64:
+                table.append((_D_FLOAT, None, 8, struct.Struct('!d')))
+            elif ib == CBOR_BREAK:
+                table.append((_D_BREAK, None, 0, None))
+            else:
+                table.append((_D_INVALID, None, 0, None))
+            continue
+        action = _MAJOR_ACTIONS[major]
+        if info <= 23:
+            table.append((action, info, 0, None))
+        elif info in _AUX_STRUCTS:
+            aux_struct = _AUX_STRUCTS[info]
+            table.append((action, None, aux_struct.size, aux_struct))
+        elif info == CBOR_VAR_FOLLOWS and action in (_D_BYTES, _D_TEXT, _D_ARRAY, _D_MAP):
+            table.append((action, None, 0, None))
+        else:
+            # reserved additional information, or indefinite length for a type without length
+            table.append((_D_INVALID, None, 0, None))
+    return tuple(table)
+
+
+_INITIAL_BYTE_TABLE = _build_initial_byte_table()
+
+# kinds of the container being filled
+_F_TOP = 0
+_F_ARRAY = 1
+_F_MAP = 2
+_F_TAG = 3
+
+# marks a map that waits for its next key
+_NO_KEY = object()
+
+
+def _decode_string_chunks(mv, pos, end, action):
+    """Join the chunks of an indefinite length byte or text string, return (bytes, new pos)."""
+    chunks = []
+    while True:
+        if pos >= end:
+            raise EOFError()
+        ib = mv[pos]
+        pos += 1
+        if ib == CBOR_BREAK:
+            return b''.join(chunks), pos
+        chunk_action, aux, nbytes, aux_struct = _INITIAL_BYTE_TABLE[ib]
+        if chunk_action != action or (aux is None and nbytes == 0):
+            raise ValueError('variable length value contains unexpected component')
+        if nbytes:
+            if pos + nbytes > end:
+                raise EOFError()
+            aux = aux_struct.unpack_from(mv, pos)[0]
+            pos += nbytes
+        if pos + aux > end:
+            raise EOFError()
+        chunks.append(mv[pos:pos + aux])
+        pos += aux
+
+
+def _decode(data, pos=0, zero_copy=False, returntags=False, tag_hook=None):
+    """
+    Decode the CBOR item starting at data[pos], return (object, position after it).
+    With zero_copy byte strings are returned as memoryview slices of data.
+    Raises EOFError if data ends before the item does.
     """
-    return _loads(fp)[0]
+    mv = memoryview(data)
+    if mv.ndim != 1 or mv.itemsize != 1:
+        mv = mv.cast('B')
+    # indexing and slicing bytes is cheaper than going through the memoryview
+    buf = data if type(data) is bytes else mv
+    end = len(mv)
+    table = _INITIAL_BYTE_TABLE
+    # the container being filled lives in these locals, its parents are saved on the stack
+    kind = _F_TOP
+    container = None
+    left = None
+    key = _NO_KEY
+    stack = []
+    while True:
+        if pos >= end:
+            raise EOFError()
+        ib = buf[pos]
+        pos += 1
+        action, aux, nbytes, aux_struct = table[ib]
+        if nbytes:
+            if pos + nbytes > end:
+                raise EOFError()
+            aux = aux_struct.unpack_from(mv, pos)[0]
+            pos += nbytes
+
+        if action == _D_TEXT:
+            if aux is None:
+                raw, pos = _decode_string_chunks(mv, pos, end, action)
+                value = raw.decode('utf8')
+            else:
+                if pos + aux > end:
+                    raise EOFError()
+                value = str(buf[pos:pos + aux], 'utf8')
+                pos += aux
+        elif action == _D_UINT or action == _D_SIMPLE or action == _D_FLOAT:
+            value = aux
+        elif action == _D_MAP or action == _D_ARRAY:
+            if aux == 0:
+                value = {} if action == _D_MAP else []
+            else:
+                stack.append((kind, container, left, key))
+                if action == _D_MAP:
+                    kind = _F_MAP
+                    container = {}
+                else:
+                    kind = _F_ARRAY
+                    container = []
+                left = aux
+                key = _NO_KEY
+                continue
+        elif action == _D_NEGINT:
+            value = -1 - aux
+        elif action == _D_BYTES:
+            if aux is None:
+                value, pos = _decode_string_chunks(mv, pos, end, action)
+            else:
+                if pos + aux > end:
+                    raise EOFError()
+                if zero_copy:
+                    value = mv[pos:pos + aux]
+                elif buf is data:
+                    value = buf[pos:pos + aux]
+                else:
+                    value = mv[pos:pos + aux].tobytes()
+                pos += aux
+        elif action == _D_TAG:
+            stack.append((kind, container, left, key))
+            kind = _F_TAG
+            container = aux
+            left = 1
+            continue
+        elif action == _D_BREAK:
+            if kind not in (_F_ARRAY, _F_MAP) or left is not None:
+                raise ValueError("unexpected cbor break")
+            if key is not _NO_KEY:
+                raise ValueError("cbor map ended between key and value")
+            value = container
+            kind, container, left, key = stack.pop()
+        else:
+            raise ValueError("unknown cbor initial byte: {:02x}".format(ib))
+
+        # hand the value to the container being filled, closing every container that is complete
+        while True:
+            if kind == _F_MAP:
+                if key is _NO_KEY:
+                    # map keys have to be hashable, a view of a bytearray is not
+                    key = value.tobytes() if type(value) is memoryview else value
+                    break
+                container[key] = value
+                key = _NO_KEY
+            elif kind == _F_ARRAY:
+                container.append(value)
+            elif kind == _F_TAG:
+                if returntags:
+                    value = Tag(container, value)
+                elif tag_hook is not None:
+                    value = tag_hook(container, value)
+                else:
+                    value = tagify(value, container)
+                kind, container, left, key = stack.pop()
+                continue
+            else:
+                return value, pos
+            if left is None:
+                break
+            left -= 1
+            if left:
+                break
+            value = container
+            kind, container, left, key = stack.pop()
+
 
 
+def _item_end(data, pos, pending):
+    """
+    Find where the CBOR item starting in data ends without decoding it.
+    pending holds how many items each open container still needs, innermost last,
+    None for indefinite length. It is kept up to date so that a scan which ran out
+    of data can be resumed once more has arrived.
+    Returns (position after the item or None if data ends first, position to resume from).
+    """
+    mv = memoryview(data)
+    if mv.ndim != 1 or mv.itemsize != 1:
+        mv = mv.cast('B')
+    buf = data if type(data) is bytes else mv
+    end = len(mv)
+    table = _INITIAL_BYTE_TABLE
+    while pos < end:
+        ib = buf[pos]
+        action, aux, nbytes, aux_struct = table[ib]
+        nxt = pos + 1 + nbytes
+        if nxt > end:
+            break
+        if nbytes:
+            aux = aux_struct.unpack_from(mv, pos + 1)[0]
+        if action == _D_BYTES or action == _D_TEXT:
+            if aux is None:
+                # chunks up to a break
+                pending.append(None)
+                pos = nxt
+                continue
+            nxt += aux
+            if nxt > end:
+                break
+        elif action == _D_ARRAY or action == _D_MAP:
+            if aux is None or aux:
+                if action == _D_MAP and aux:
+                    aux *= 2
+                pending.append(aux)
+                pos = nxt
+                continue
+        elif action == _D_TAG:
+            pending.append(1)
+            pos = nxt
+            continue
+        elif action == _D_BREAK:
+            if not pending or pending[-1] is not None:
+                raise ValueError("unexpected cbor break")
+            pending.pop()
+        elif action == _D_INVALID:
+            raise ValueError("unknown cbor initial byte: {:02x}".format(ib))
+        pos = nxt
+        # an item is complete, close every container it completes
+        while pending:
+            left = pending[-1]
+            if left is None:
+                break
+            if left > 1:
+                pending[-1] = left - 1
+                break
+            pending.pop()
+        else:
+            return pos, pos
+    return None, pos
+
 _MAX_DEPTH = 100
 
 
@@ -311,76 +893,115 @@ def _read_byte(fp):
     return ord(tb)
 
 
-def _loads_var_array(fp, limit, depth, returntags, bytes_read):
-    ob = []
+def _iter_var_array(fp, limit, depth, returntags, tag_hook):
+    "yield (item, bytes read) for the items of an indefinite length array, reading fp up to its break"
     tb = _read_byte(fp)
     while tb != CBOR_BREAK:
-        (subob, sub_len) = _loads_tb(fp, tb, limit, depth, returntags)
-        bytes_read += 1 + sub_len
-        ob.append(subob)
+        (subob, sub_len) = _loads_tb(fp, tb, limit, depth, returntags, tag_hook)
+        yield (subob, 1 + sub_len)
         tb = _read_byte(fp)
-    return (ob, bytes_read + 1)
 
 
-def _loads_var_map(fp, limit, depth, returntags, bytes_read):
-    ob = {}
+def _iter_var_map(fp, limit, depth, returntags, tag_hook):
+    "yield (key, value, bytes read) for the pairs of an indefinite length map, reading fp up to its break"
     tb = _read_byte(fp)
     while tb != CBOR_BREAK:
-        (subk, sub_len) = _loads_tb(fp, tb, limit, depth, returntags)
-        bytes_read += 1 + sub_len
-        (subv, sub_len) = _loads(fp, limit, depth, returntags)
+        (subk, k_len) = _loads_tb(fp, tb, limit, depth, returntags, tag_hook)
+        (subv, v_len) = _loads(fp, limit, depth, returntags, tag_hook)
+        yield (subk, subv, 1 + k_len + v_len)
+        tb = _read_byte(fp)
+
+
+def _loads_var_array(fp, limit, depth, returntags, tag_hook, bytes_read):
+    ob = []
+    for (subob, sub_len) in _iter_var_array(fp, limit, depth, returntags, tag_hook):
+        bytes_read += sub_len
+        ob.append(subob)
+    return (ob, bytes_read + 1)
+
+
+def _loads_var_map(fp, limit, depth, returntags, tag_hook, bytes_read):
+    ob = {}
+    for (subk, subv, sub_len) in _iter_var_map(fp, limit, depth, returntags, tag_hook):
         bytes_read += sub_len
         ob[subk] = subv
-        tb = _read_byte(fp)
     return (ob, bytes_read + 1)
 
 
+def iterload(fp, returntags=False, tag_hook=None):
+    """
+    Read the array or map at the start of fp one entry at a time, without building it.
+    Yields the items of an array or (key, value) pairs of a map, for definite and
+    indefinite length ones. fp is read only as far as the entries taken so far.
+    tag_hook: as for loads()
+    """
+    tb = _read_byte(fp)
+    if tb & CBOR_TYPE_MASK not in (CBOR_ARRAY, CBOR_MAP):
+        raise ValueError("iterload needs a cbor array or map, got initial byte {:02x}".format(tb))
+    tag, tag_aux, aux, bytes_read = _tag_aux(fp, tb)
+    if tag == CBOR_ARRAY:
+        if aux is None:
+            for (subob, sub_len) in _iter_var_array(fp, None, 0, returntags, tag_hook):
+                yield subob
+        else:
+            for i in range(aux):
+                yield _loads(fp, None, 0, returntags, tag_hook)[0]
+    else:
+        if aux is None:
+            for (subk, subv, sub_len) in _iter_var_map(fp, None, 0, returntags, tag_hook):
+                yield (subk, subv)
+        else:
+            for i in range(aux):
+                subk = _loads(fp, None, 0, returntags, tag_hook)[0]
+                yield (subk, _loads(fp, None, 0, returntags, tag_hook)[0])
+
+
 if _IS_PY3:
-    def _loads_array(fp, limit, depth, returntags, aux, bytes_read):
+    def _loads_array(fp, limit, depth, returntags, tag_hook, aux, bytes_read):
         ob = []
         for i in range(aux):
-            subob, subpos = _loads(fp)
+            subob, subpos = _loads(fp, limit, depth, returntags, tag_hook)
             bytes_read += subpos
             ob.append(subob)
         return ob, bytes_read
-    def _loads_map(fp, limit, depth, returntags, aux, bytes_read):
+    def _loads_map(fp, limit, depth, returntags, tag_hook, aux, bytes_read):
         ob = {}
         for i in range(aux):
-            subk, subpos = _loads(fp)
+            subk, subpos = _loads(fp, limit, depth, returntags, tag_hook)
             bytes_read += subpos
-            subv, subpos = _loads(fp)
+            subv, subpos = _loads(fp, limit, depth, returntags, tag_hook)
             bytes_read += subpos
             ob[subk] = subv
         return ob, bytes_read
 else:
-    def _loads_array(fp, limit, depth, returntags, aux, bytes_read):
+    def _loads_array(fp, limit, depth, returntags, tag_hook, aux, bytes_read):
         ob = []
         for i in xrange(aux):
-            subob, subpos = _loads(fp)
+            subob, subpos = _loads(fp, limit, depth, returntags, tag_hook)
             bytes_read += subpos
             ob.append(subob)
         return ob, bytes_read
-    def _loads_map(fp, limit, depth, returntags, aux, bytes_read):
+    def _loads_map(fp, limit, depth, returntags, tag_hook, aux, bytes_read):
         ob = {}
         for i in xrange(aux):
-            subk, subpos = _loads(fp)
+            subk, subpos = _loads(fp, limit, depth, returntags, tag_hook)
             bytes_read += subpos
-            subv, subpos = _loads(fp)
+            subv, subpos = _loads(fp, limit, depth, returntags, tag_hook)
             bytes_read += subpos
             ob[subk] = subv
         return ob, bytes_read
         
 
-def _loads(fp, limit=None, depth=0, returntags=False):
+def _loads(fp, limit=None, depth=0, returntags=False, tag_hook=None):
     "return (object, bytes read)"
     if depth > _MAX_DEPTH:
         raise Exception("hit CBOR loads recursion depth limit")
 
     tb = _read_byte(fp)
 
-    return _loads_tb(fp, tb, limit, depth, returntags)
+    return _loads_tb(fp, tb, limit, depth, returntags, tag_hook)
 
-def _loads_tb(fp, tb, limit=None, depth=0, returntags=False):
+def _loads_tb(fp, tb, limit=None, depth=0, returntags=False, tag_hook=None):
     # Some special cases of CBOR_7 best handled by special struct.unpack logic here
     if tb == CBOR_FLOAT16:
         data = fp.read(2)
@@ -423,18 +1044,20 @@ def _loads_tb(fp, tb, limit=None, depth=0, returntags=False):
         return (ob, bytes_read + subpos)
     elif tag == CBOR_ARRAY:
         if aux is None:
-            return _loads_var_array(fp, limit, depth, returntags, bytes_read)
-        return _loads_array(fp, limit, depth, returntags, aux, bytes_read)
+            return _loads_var_array(fp, limit, depth, returntags, tag_hook, bytes_read)
+        return _loads_array(fp, limit, depth, returntags, tag_hook, aux, bytes_read)
     elif tag == CBOR_MAP:
         if aux is None:
-            return _loads_var_map(fp, limit, depth, returntags, bytes_read)
-        return _loads_map(fp, limit, depth, returntags, aux, bytes_read)
+            return _loads_var_map(fp, limit, depth, returntags, tag_hook, bytes_read)
+        return _loads_map(fp, limit, depth, returntags, tag_hook, aux, bytes_read)
     elif tag == CBOR_TAG:
-        ob, subpos = _loads(fp)
+        ob, subpos = _loads(fp, limit, depth, returntags, tag_hook)
         bytes_read += subpos
         if returntags:
             # Don't interpret the tag, return it and the tagged object.
             ob = Tag(aux, ob)
+        elif tag_hook is not None:
+            ob = tag_hook(aux, ob)
         else:
             # attempt to interpet the tag and the value into a Python object.
             ob = tagify(ob, aux)
@@ -477,18 +1100,12 @@ def loads_bytes(fp, aux, btag=CBOR_BYTES):
 
 if _IS_PY3:
     def _bytes_to_biguint(bs):
-        out = 0
-        for ch in bs:
-            out = out << 8
-            out = out | ch
-        return out
+        return int.from_bytes(bs, 'big')
 else:
     def _bytes_to_biguint(bs):
-        out = 0
-        for ch in bs:
-            out = out << 8
-            out = out | ord(ch)
-        return out
+        if not len(bs):
+            return 0
+        return long(binascii.hexlify(bs), 16)
 
 
 def tagify(ob, aux):
@@ -0,0 +1,233 @@
+from __future__ import absolute_import
+import asyncio
+import logging
+import socket
+
+import cbor
+from cbor.cbor_rpc_client import CborRpcError, _response_error, _item_end, _decode
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCborRpcClient(object):
+    '''asyncio counterpart of :class:`cbor.cbor_rpc_client.CborRpcClient`.
+
+    Takes the same `addr_family`, `address`, `retries` and
+    `base_retry_seconds` configuration, plus `timeout` (default None), the
+    deadline in seconds for a call including its retries.
+
+    Any number of calls can be outstanding at once. They share one
+    connection and a single reader task hands each response to its call by
+    id. Waiting between retries is an ``asyncio.sleep``, so cancelling the
+    calling task stops the backoff as well.
+
+    The client belongs to the event loop it is first used on. Inside
+    Blender that loop can be driven from ``bpy.app.timers`` with
+    :func:`run_ready`.
+
+    .. automethod:: __init__
+    .. automethod:: _rpc
+    .. automethod:: call
+    .. automethod:: close
+
+    '''
+
+    def __init__(self, config=None):
+        self._socket_family = config.get('addr_family', socket.AF_INET)
+        self._socket_addr = config.get('address')
+        if self._socket_family == socket.AF_INET:
+            if not isinstance(self._socket_addr, tuple):
+                tsocket_addr = tuple(self._socket_addr)
+                assert len(tsocket_addr) == 2, 'address must be length-2 tuple ("hostname", port number), got {!r} tuplified to {!r}'.format(self._socket_addr, tsocket_addr)
+                self._socket_addr = tsocket_addr
+        self._writer = None
+        self._reader_task = None
+        self._message_count = 0
+        # futures waiting for a response, by message id
+        self._pending = {}
+        # created on the event loop, by _conn()
+        self._conn_lock = None
+        self._drain_lock = None
+        self._retries = config.get('retries', 5)
+        self._base_retry_seconds = float(config.get('base_retry_seconds', 0.5))
+        self._timeout = config.get('timeout')
+
+    async def _conn(self):
+        # lazy connection opener
+        if self._conn_lock is None:
+            self._conn_lock = asyncio.Lock()
+            self._drain_lock = asyncio.Lock()
+        async with self._conn_lock:
+            if self._writer is None:
+                try:
+                    if self._socket_family == socket.AF_UNIX:
+                        reader, writer = await asyncio.open_unix_connection(self._socket_addr)
+                    else:
+                        reader, writer = await asyncio.open_connection(*self._socket_addr)
+                except Exception:
+                    logger.error('error connecting to %r', self._socket_addr, exc_info=True)
+                    raise
+                self._writer = writer
+                self._reader_task = asyncio.ensure_future(self._read_responses(reader, writer))
+        return self._writer
+
+    async def _read_responses(self, reader, writer):
+        # decode responses as they arrive and resolve their calls
+        buf = bytearray()
+        pending = []
+        scanned = 0
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    raise EOFError('connection closed by server')
+                buf += data
+                start = 0
+                view = memoryview(buf)
+                try:
+                    while True:
+                        item_end, scanned = _item_end(view, scanned, pending)
+                        if item_end is None:
+                            break
+                        self._resolve(_decode(view[start:item_end])[0])
+                        start = item_end
+                finally:
+                    view.release()
+                del buf[:start]
+                scanned -= start
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex:
+            logger.debug('connection to %r lost', self._socket_addr, exc_info=True)
+            if self._writer is writer:
+                self._drop(ex)
+
+    def _resolve(self, response):
+        logging.getLogger('cborrpc').debug('response %r', response)
+        future = self._pending.pop(response.get('id'), None)
+        if future is None or future.done():
+            # its call gave up before the response came
+            return
+        if 'result' in response:
+            future.set_result(response['result'])
+        else:
+            future.set_exception(_response_error(response))
+
+    def _drop(self, ex):
+        # forget the connection, failing every call still waiting on it
+        writer, self._writer = self._writer, None
+        reader_task, self._reader_task = self._reader_task, None
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ex)
+        if reader_task is not None and reader_task is not asyncio.current_task():
+            reader_task.cancel()
+        if writer is not None:
+            writer.close()
+
+    async def close(self):
+        '''Close the connection to the server.
+
+        The next RPC call will reopen the connection.
+
+        '''
+        writer = self._writer
+        self._drop(ConnectionError('connection closed'))
+        if writer is not None:
+            try:
+                await writer.wait_closed()
+            except Exception:
+                logger.warning('error closing client connection', exc_info=True)
+
+    async def call(self, method_name, params, timeout=None):
+        '''Call ``method_name(*params)`` once, without retrying.
+
+        timeout covers the whole call: connecting, sending the request
+        and waiting for the response.
+
+        :raise CborRpcError: if the server response was a failure
+        :raise asyncio.TimeoutError: if there is no response within timeout seconds
+
+        '''
+        return await asyncio.wait_for(self._call(method_name, params), timeout)
+
+    async def _call(self, method_name, params):
+        writer = await self._conn()
+        self._message_count += 1
+        message = {
+            'id': self._message_count,
+            'method': method_name,
+            'params': params
+        }
+        logging.getLogger('cborrpc').debug('request %r', message)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message['id']] = future
+        try:
+            writer.write(cbor.dumps(message))
+            async with self._drain_lock:
+                await writer.drain()
+            return await future
+        finally:
+            self._pending.pop(message['id'], None)
+
+    async def _rpc(self, method_name, params, timeout=None):
+        '''Call a method on the server.
+
+        Calls ``method_name(*params)`` remotely, and returns the results
+        of that function call, retrying with the same backoff as
+        :class:`CborRpcClient`. timeout overrides the configured deadline
+        for the call and its retries.
+
+        :raise CborRpcError: if the server response was a failure
+        :raise asyncio.TimeoutError: if the deadline passes
+
+        '''
+        loop = asyncio.get_running_loop()
+        if timeout is None:
+            timeout = self._timeout
+        deadline = None if timeout is None else loop.time() + timeout
+        tryn = 0
+        delay = self._base_retry_seconds
+        while True:
+            remaining = None if deadline is None else deadline - loop.time()
+            if remaining is not None and remaining <= 0:
+                raise asyncio.TimeoutError()
+            try:
+                return await self.call(method_name, params, remaining)
+            except (CborRpcError, asyncio.TimeoutError, asyncio.CancelledError):
+                # errors from the server aren't retried, and neither is
+                # running out of time or being cancelled
+                raise
+            except Exception as ex:
+                if tryn < self._retries:
+                    tryn += 1
+                    logger.debug('ex in %r (%s), retrying %s in %s sec...',
+                                 method_name, ex, tryn, delay, exc_info=True)
+                    await self.close()
+                    if deadline is not None:
+                        await asyncio.sleep(max(0, min(delay, deadline - loop.time())))
+                    else:
+                        await asyncio.sleep(delay)
+                    delay *= 2
+                    continue
+                logger.error('failed in rpc %r %r', method_name, params,
+                             exc_info=True)
+                raise
+
+
+def run_ready(loop):
+    '''Run the callbacks that are ready on loop, then return.
+
+    Registered with ``bpy.app.timers`` this keeps an event loop going
+    without blocking Blender, e.g.::
+
+        def step():
+            run_ready(loop)
+            return 0.01
+        bpy.app.timers.register(step)
+
+    '''
+    loop.call_soon(loop.stop)
+    loop.run_forever()
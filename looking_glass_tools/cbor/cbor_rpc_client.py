@@ -1,10 +1,16 @@
 from __future__ import absolute_import
+import contextlib
 import logging
 import random
+import select
 import socket
+import threading
 import time
+from concurrent import futures
 
 import cbor
+from cbor import _decode
+from cbor.cbor import _item_end
 
 
 logger = logging.getLogger(__name__)
@@ -12,23 +18,248 @@ logger = logging.getLogger(__name__)
 
 class SocketReader(object):
     '''
-    Simple adapter from socket.recv to file-like-read
+    Buffered adapter from socket.recv_into to file-like read/readinto.
+
+    Received bytes land in one preallocated bytearray that is reused for
+    every message, and load() decodes replies straight out of it.
+
+    Each read(), readinto() or load() gets timeout_seconds in total to
+    wait for data with select(), socket.timeout is raised when it runs out
+    and EOFError when the server closes the connection.
     '''
-    def __init__(self, sock):
+    def __init__(self, sock, bufsize=65536):
         self.socket = sock
         self.timeout_seconds = 10.0
+        self._buf = bytearray(bufsize)
+        # buffered bytes not yet consumed are self._buf[self._start:self._end]
+        self._start = 0
+        self._end = 0
+
+    def _make_room(self, room):
+        # ensure room free bytes after the buffered ones
+        if len(self._buf) - self._end >= room:
+            return
+        buffered = self._end - self._start
+        size = len(self._buf)
+        while size - buffered < room:
+            size *= 2
+        if size == len(self._buf):
+            self._buf[:buffered] = self._buf[self._start:self._end]
+        else:
+            buf = bytearray(size)
+            buf[:buffered] = self._buf[self._start:self._end]
+            self._buf = buf
+        self._start = 0
+        self._end = buffered
+
+    def _wait(self, deadline):
+        # select() leaves the socket's own timeout alone, which other
+        # threads may be sending with
+        remaining = deadline - time.time()
+        if remaining <= 0 or not select.select([self.socket], [], [], remaining)[0]:
+            raise socket.timeout('timed out')
+
+    def _recv(self, deadline, room):
+        # one recv_into() with at least room bytes free to receive into
+        self._make_room(room)
+        self._wait(deadline)
+        n = self.socket.recv_into(memoryview(self._buf)[self._end:])
+        if not n:
+            raise EOFError('connection closed by server')
+        self._end += n
+
+    def _fill(self, num, deadline):
+        while self._end - self._start < num:
+            self._recv(deadline, num - (self._end - self._start))
+
+    def _consume(self, num):
+        self._start += num
+        if self._start == self._end:
+            self._start = self._end = 0
 
     def read(self, num):
-        start = time.time()
-        data = self.socket.recv(num)
-        while len(data) < num:
-            now = time.time()
-            if now > (start + self.timeout_seconds):
-                break
-            ndat = self.socket.recv(num - len(data))
-            if ndat:
-                data += ndat
-        return data
+        deadline = time.time() + self.timeout_seconds
+        self._fill(num, deadline)
+        start = self._start
+        self._consume(num)
+        return bytes(memoryview(self._buf)[start:start + num])
+
+    def readinto(self, b):
+        '''Fill all of b, return the number of bytes written to it.'''
+        deadline = time.time() + self.timeout_seconds
+        view = memoryview(b)
+        if view.ndim != 1 or view.itemsize != 1:
+            view = view.cast('B')
+        want = len(view)
+        n = min(want, self._end - self._start)
+        view[:n] = memoryview(self._buf)[self._start:self._start + n]
+        self._consume(n)
+        # anything beyond the buffered bytes is received into b directly
+        while n < want:
+            self._wait(deadline)
+            got = self.socket.recv_into(view[n:])
+            if not got:
+                raise EOFError('connection closed by server')
+            n += got
+        return n
+
+    def load(self, tag_hook=None, timeout=None):
+        '''Receive and decode one CBOR item.
+
+        timeout shortens the wait below timeout_seconds. Bytes of an item
+        that did not arrive in time stay buffered for the next load().
+        '''
+        if timeout is None or timeout > self.timeout_seconds:
+            timeout = self.timeout_seconds
+        deadline = time.time() + timeout
+        # the item is scanned as it arrives and only decoded once it is complete
+        pending = []
+        scanned = 0
+        while True:
+            view = memoryview(self._buf)[self._start:self._end]
+            try:
+                item_end, scanned = _item_end(view, scanned, pending)
+                if item_end is not None:
+                    ob = _decode(view[:item_end], tag_hook=tag_hook)[0]
+            finally:
+                # the buffer can't be moved or resized while it is exported
+                view.release()
+            if item_end is not None:
+                self._consume(item_end)
+                return ob
+            # leave room to at least double what is buffered
+            self._recv(deadline, max(self._end - self._start, 1))
+
+
+class ConnectionPool(object):
+    '''Open connections kept for reuse, by address.
+
+    Up to `max_idle` idle connections are kept per address, for at most
+    `idle_seconds` each. A connection is checked before it is handed out
+    again, one the server has closed or sent unexpected data on is
+    dropped.
+
+    `metrics` counts ``connects`` (new connections), ``reuses`` (idle
+    connections handed out again), ``failures`` (failed connection
+    attempts and connections dropped after an error) and ``expired``
+    (idle connections dropped for age, a failed check or lack of room).
+
+    '''
+
+    def __init__(self, max_idle=4, idle_seconds=60.0):
+        self.max_idle = max_idle
+        self.idle_seconds = idle_seconds
+        # address -> [(socket, time it went idle)], most recent last
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.metrics = {'connects': 0, 'reuses': 0, 'failures': 0, 'expired': 0}
+
+    def get(self, address):
+        '''Return an idle connection to address, or a new one.'''
+        while True:
+            with self._lock:
+                idle = self._idle.get(address)
+                if not idle:
+                    break
+                sock, since = idle.pop()
+            if time.time() - since < self.idle_seconds and _is_healthy(sock):
+                with self._lock:
+                    self.metrics['reuses'] += 1
+                return sock
+            self._close(sock, 'expired')
+        try:
+            sock = socket.create_connection(address)
+        except:
+            with self._lock:
+                self.metrics['failures'] += 1
+            logger.error('error connecting to %r:%r', address[0],
+                         address[1], exc_info=True)
+            raise
+        with self._lock:
+            self.metrics['connects'] += 1
+        return sock
+
+    def put(self, address, sock):
+        '''Keep sock as an idle connection to address.'''
+        with self._lock:
+            idle = self._idle.setdefault(address, [])
+            if len(idle) < self.max_idle:
+                idle.append((sock, time.time()))
+                return
+        self._close(sock, 'expired')
+
+    def discard(self, sock):
+        '''Close sock after an error instead of keeping it.'''
+        self._close(sock, 'failures')
+
+    def clear(self):
+        '''Close all idle connections.'''
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for sock, since in conns:
+                self._close(sock, 'expired')
+
+    def _close(self, sock, metric):
+        with self._lock:
+            self.metrics[metric] += 1
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+            sock.close()
+        except socket.error:
+            logger.warn('error closing lockd client socket',
+                        exc_info=True)
+
+
+def _is_healthy(sock):
+    # an idle connection has nothing to read, readable means the server
+    # closed it or sent something no call is waiting for
+    try:
+        return not select.select([sock], [], [], 0)[0]
+    except (ValueError, socket.error):
+        return False
+
+
+default_pool = ConnectionPool()
+
+
+class CborRpcError(Exception):
+    '''The server answered a call with an error.'''
+
+
+def _response_error(response):
+    # From here on out we got a response, the server didn't have some
+    # weird intermittent error or non-connectivity, it gave us an
+    # error message.
+    errormessage = response.get('error')
+    if errormessage and hasattr(errormessage,'get'):
+        errormessage = errormessage.get('message')
+    if not errormessage:
+        errormessage = repr(response)
+    return CborRpcError(errormessage)
+
+
+class PendingCall(futures.Future):
+    '''Future for a call sent with :meth:`CborRpcClient.call_async`.
+
+    :meth:`result` and :meth:`exception` read responses off the
+    connection until this call's response has arrived, whichever thread
+    they are called from.
+
+    '''
+
+    def __init__(self, client, message):
+        super(PendingCall, self).__init__()
+        self._client = client
+        self.message = message
+
+    def result(self, timeout=None):
+        self._client._wait_for(self, timeout)
+        return super(PendingCall, self).result(0)
+
+    def exception(self, timeout=None):
+        self._client._wait_for(self, timeout)
+        return super(PendingCall, self).exception(0)
 
 
 class CborRpcClient(object):
@@ -44,8 +275,20 @@ class CborRpcClient(object):
     3; wait 4s; try 4; wait 8s; try 5; FAIL. Total time waited just
     under base_retry_seconds * (2 ** retries).
 
+    Connections come from the ``pool`` configuration parameter, by
+    default the module's :data:`default_pool` shared by all clients, and
+    go back to it on :meth:`close`. With ``pool`` None the client opens
+    and closes its own connections.
+
+    Calls can be pipelined: :meth:`call_async` sends a call and returns a
+    :class:`PendingCall` right away, so several calls are in flight on the
+    one connection and responses are matched to them by id. Inside
+    :meth:`batch` the calls are queued and sent together in one write.
+
     .. automethod:: __init__
     .. automethod:: _rpc
+    .. automethod:: call_async
+    .. automethod:: batch
     .. automethod:: close
 
     '''
@@ -60,48 +303,207 @@ class CborRpcClient(object):
                 tsocket_addr = tuple(self._socket_addr)
                 assert len(tsocket_addr) == 2, 'address must be length-2 tuple ("hostname", port number), got {!r} tuplified to {!r}'.format(self._socket_addr, tsocket_addr)
                 self._socket_addr = tsocket_addr
+        self._pool = config.get('pool', default_pool)
+        if self._pool is None:
+            # every client its own connection
+            self._pool = ConnectionPool(max_idle=0)
         self._socket = None
         self._rfile = None
         self._local_addr = None
         self._message_count = 0
+        # calls waiting for a response, by message id
+        self._pending = {}
+        # encoded calls queued by batch(), None outside of it
+        self._batch = None
+        self._lock = threading.Lock()
+        self._read_lock = threading.Lock()
+        # held while a request is written, so that requests sent from
+        # several threads don't interleave on the socket
+        self._send_lock = threading.Lock()
         self._retries = config.get('retries', 5)
         self._base_retry_seconds = float(config.get('base_retry_seconds', 0.5))
 
     def _conn(self):
-        # lazy socket opener
-        if self._socket is None:
-            try:
-                self._socket = socket.create_connection(self._socket_addr)
-                self._local_addr = self._socket.getsockname()
-            except:
-                logger.error('error connecting to %r:%r', self._socket_addr[0],
-                             self._socket_addr[1], exc_info=True)
-                raise
-        return self._socket
+        # lazy socket opener, locked so that threads making their first
+        # call at the same time share one connection
+        with self._lock:
+            if self._socket is None:
+                sock = self._pool.get(self._socket_addr)
+                self._local_addr = sock.getsockname()
+                self._rfile = SocketReader(sock)
+                self._socket = sock
+            return self._socket
 
     def close(self):
         '''Close the connection to the server.
 
-        The next RPC call will reopen the connection.
+        A connection with no calls in flight goes back to the connection
+        pool for the next client of the same address. The next RPC call
+        will reopen or reuse a connection.
 
         '''
-        if self._socket is not None:
-            self._rfile = None
-            try:
-                self._socket.shutdown(socket.SHUT_RDWR)
-                self._socket.close()
-            except socket.error:
-                logger.warn('error closing lockd client socket',
-                            exc_info=True)
-            self._socket = None
+        self._release(True)
+
+    def _release(self, reuse):
+        # give the connection back to the pool, or close it after an error
+        # or while calls still wait on it, as their responses would reach
+        # its next user
+        if self._fail_pending(socket.error('connection closed')):
+            reuse = False
+        with self._lock:
+            sock, self._socket = self._socket, None
+            rfile, self._rfile = self._rfile, None
+        if sock is not None:
+            if rfile is not None and rfile._start != rfile._end:
+                reuse = False
+            if reuse:
+                self._pool.put(self._socket_addr, sock)
+            else:
+                self._pool.discard(sock)
+
+    def _fail_pending(self, ex):
+        # nothing sent so far gets a response any more, return whether
+        # there was anything
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._batch:
+                del self._batch[:]
+        for call in pending.values():
+            if not call.done():
+                call.set_exception(ex)
+        return bool(pending)
 
     @property
     def rfile(self):
-        if self._rfile is None:
-            conn = self._conn()
-            self._rfile = SocketReader(conn)
+        # opened together with the socket by _conn()
+        self._conn()
         return self._rfile
 
+    def _send(self, buf):
+        try:
+            with self._send_lock:
+                self._conn().sendall(buf)
+        except Exception as ex:
+            self._fail_pending(ex)
+            self._release(False)
+            raise
+
+    def call_async(self, method_name, params):
+        '''Send ``method_name(*params)`` without waiting for the response.
+
+        Returns a :class:`PendingCall` that resolves to the result, or
+        raises :class:`CborRpcError` if the server answered with an error.
+        Calls are not retried, a connection failure is set as the
+        exception of every call still in flight.
+
+        '''
+        with self._lock:
+            self._message_count += 1
+            message = {
+                'id': self._message_count,
+                'method': method_name,
+                'params': params
+            }
+            call = PendingCall(self, message)
+            self._pending[message['id']] = call
+            logging.getLogger('cborrpc').debug('request %r', message)
+            buf = cbor.dumps(message)
+            if self._batch is not None:
+                self._batch.append((call, buf))
+                return call
+        call.set_running_or_notify_cancel()
+        self._send(buf)
+        return call
+
+    @contextlib.contextmanager
+    def batch(self):
+        '''Queue calls made with :meth:`call_async` and send them in one write.
+
+        The calls are sent when the block exits, or earlier if one of them
+        is waited for inside it. If the block raises, the calls still
+        queued are cancelled. Nested batches are part of the outer one.
+
+        '''
+        with self._lock:
+            outer = self._batch is None
+            if outer:
+                self._batch = []
+        if not outer:
+            yield self
+            return
+        try:
+            yield self
+        except BaseException:
+            with self._lock:
+                queued, self._batch = self._batch, None
+                for call, buf in queued:
+                    self._pending.pop(call.message['id'], None)
+                    call.cancel()
+            raise
+        self._flush(end=True)
+
+    def _flush(self, end=False):
+        # send the calls queued by batch()
+        with self._lock:
+            queued = self._batch
+            if queued is None:
+                return
+            self._batch = None if end else []
+            bufs = []
+            for call, buf in queued:
+                if call.set_running_or_notify_cancel():
+                    bufs.append(buf)
+                else:
+                    self._pending.pop(call.message['id'], None)
+        if bufs:
+            self._send(b''.join(bufs))
+
+    def _wait_for(self, call, timeout=None):
+        # read responses until the one for call has arrived, raise
+        # futures.TimeoutError if that takes more than timeout seconds
+        if call.done():
+            return
+        deadline = None if timeout is None else time.time() + timeout
+        if not call.running():
+            self._flush()
+        while not call.done():
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise futures.TimeoutError()
+            if not self._read_lock.acquire(False):
+                # another thread is reading, it may read this response too
+                futures.wait([call], timeout=0.01 if remaining is None else min(0.01, remaining))
+                continue
+            rfile = None
+            try:
+                rfile = self.rfile
+                response = rfile.load(timeout=remaining)
+            except Exception as ex:
+                if (isinstance(ex, socket.timeout) and rfile is not None and
+                        remaining is not None and remaining < rfile.timeout_seconds):
+                    # only the caller's timeout ran out, the connection is fine
+                    raise futures.TimeoutError()
+                self._fail_pending(ex)
+                self._release(False)
+                return
+            finally:
+                self._read_lock.release()
+            self._resolve(response)
+
+    def _resolve(self, response):
+        logging.getLogger('cborrpc').debug('response %r', response)
+        with self._lock:
+            call = self._pending.pop(response.get('id'), None)
+        if call is None:
+            logger.warn('response for no pending call: %r', response)
+            return
+        if 'result' in response:
+            call.set_result(response['result'])
+            return
+        call.set_exception(_response_error(response))
+
     def _rpc(self, method_name, params):
         '''Call a method on the server.
 
@@ -109,54 +511,30 @@ class CborRpcClient(object):
         of that function call.  Expected return types are primitives, lists,
         and dictionaries.
 
-        :raise Exception: if the server response was a failure
+        :raise CborRpcError: if the server response was a failure
 
         '''
-        mlog = logging.getLogger('cborrpc')
         tryn = 0
         delay = self._base_retry_seconds
-        self._message_count += 1
-        message = {
-            'id': self._message_count,
-            'method': method_name,
-            'params': params
-        }
-        mlog.debug('request %r', message)
-        buf = cbor.dumps(message)
-
-        errormessage = None
         while True:
             try:
-                conn = self._conn()
-                conn.send(buf)
-                response = cbor.load(self.rfile)
-                mlog.debug('response %r', response)
-                assert response['id'] == message['id']
-                if 'result' in response:
-                    return response['result']
-                # From here on out we got a response, the server
-                # didn't have some weird intermittent error or
-                # non-connectivity, it gave us an error message. We
-                # don't retry that, we raise it to the user.
-                errormessage = response.get('error')
-                if errormessage and hasattr(errormessage,'get'):
-                    errormessage = errormessage.get('message')
-                if not errormessage:
-                    errormessage = repr(response)
-                break
+                return self.call_async(method_name, params).result()
+            except CborRpcError:
+                # We don't retry an error message from the server, we
+                # raise it to the user.
+                raise
             except Exception as ex:
                 if tryn < self._retries:
                     tryn += 1
                     logger.debug('ex in %r (%s), retrying %s in %s sec...',
                                  method_name, ex, tryn, delay, exc_info=True)
-                    self.close()
+                    self._release(False)
                     time.sleep(delay)
                     delay *= 2
                     continue
                 logger.error('failed in rpc %r %r', method_name, params,
                              exc_info=True)
                 raise
-        raise Exception(errormessage)
 
 
 if __name__ == '__main__':
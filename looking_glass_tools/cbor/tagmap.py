@@ -1,11 +1,7 @@
-try:
-    # try C library _cbor.so
-    from ._cbor import loads, dumps, load, dump
-except:
-    # fall back to 100% python implementation
-    from .cbor import loads, dumps, load, dump
+# through the package, so the accelerator is used once cbor.use_accelerator() switched to it
+from . import loads, dumps, load, dump
 
-from .cbor import Tag, CBOR_TAG_CBOR, _IS_PY3
+from .cbor import Tag, CBOR_TAG_CBOR, _IS_PY3, tagify
 
 
 class ClassTag(object):
@@ -22,17 +18,13 @@ class ClassTag(object):
         self.decode_function = decode_function
 
 
-# TODO: This would be more efficient if it moved into cbor.py and
-# cbormodule.c, happening inline so that there is only one traversal
-# of the objects. But that would require two implementations. When
-# this API has been used more and can be considered settled I should
-# do that. -- Brian Olson 20140917_172229
 class TagMapper(object):
     '''
     Translate Python objects and CBOR tagged data.
     Use the CBOR TAG system to note that some data is of a certain class.
     Dump while translating Python objects into a CBOR compatible representation.
     Load and translate CBOR primitives back into Python objects.
+    dump(s) and load(s) do this inline, as hooks of the encoder and decoder.
     '''
     def __init__(self, class_tags=None, raise_on_unknown_tag=False):
         '''
@@ -40,13 +32,54 @@ class TagMapper(object):
         '''
         self.class_tags = class_tags
         self.raise_on_unknown_tag = raise_on_unknown_tag
-
-    def encode(self, obj):
-        for ct in self.class_tags:
+        # the first ClassTag for each tag number, as the linear search found it before
+        self._by_tag = {}
+        for ct in class_tags or ():
+            self._by_tag.setdefault(ct.tag_number, ct)
+        # class -> ClassTag or None, filled in for subclasses the first time they are met
+        self._by_class = {}
+        for ct in class_tags or ():
+            if isinstance(ct.class_type, type):
+                self._class_tag(ct.class_type)
+
+    def _class_tag(self, cls):
+        try:
+            return self._by_class[cls]
+        except KeyError:
+            pass
+        found = None
+        # registration order decides between ClassTags for several of its bases
+        for ct in self.class_tags or ():
             if (ct.class_type is None) or (ct.encode_function is None):
                 continue
-            if isinstance(obj, ct.class_type):
-                return Tag(ct.tag_number, ct.encode_function(obj))
+            if issubclass(cls, ct.class_type):
+                found = ct
+                break
+        self._by_class[cls] = found
+        return found
+
+    def _encode_hook(self, obj):
+        ct = self._class_tag(type(obj))
+        if ct is None:
+            return obj
+        return Tag(ct.tag_number, ct.encode_function(obj))
+
+    def _decode_hook(self, tag_number, value):
+        ob = tagify(value, tag_number)
+        if type(ob) is not Tag:
+            # a tag the decoder knows itself, like a bignum or date
+            return ob
+        ct = self._by_tag.get(tag_number)
+        if ct is not None:
+            return ct.decode_function(value)
+        if self.raise_on_unknown_tag:
+            raise UnknownTagException(str(tag_number))
+        return ob
+
+    def encode(self, obj):
+        ct = self._class_tag(type(obj))
+        if ct is not None:
+            return Tag(ct.tag_number, ct.encode_function(obj))
         if isinstance(obj, (list, tuple)):
             return [self.encode(x) for x in obj]
         if isinstance(obj, dict):
@@ -66,9 +99,9 @@ class TagMapper(object):
 
     def decode(self, obj):
         if isinstance(obj, Tag):
-            for ct in self.class_tags:
-                if ct.tag_number == obj.tag:
-                    return ct.decode_function(obj.value)
+            ct = self._by_tag.get(obj.tag)
+            if ct is not None:
+                return ct.decode_function(obj.value)
             # unknown Tag
             if self.raise_on_unknown_tag:
                 raise UnknownTagException(str(obj.tag))
@@ -93,16 +126,16 @@ class TagMapper(object):
         return obj
 
     def dump(self, obj, fp):
-        dump(self.encode(obj), fp)
+        dump(obj, fp, hook=self._encode_hook)
 
     def dumps(self, obj):
-        return dumps(self.encode(obj))
+        return dumps(obj, hook=self._encode_hook)
 
     def load(self, fp):
-        return self.decode(load(fp))
+        return load(fp, tag_hook=self._decode_hook)
 
-    def loads(self, blob):
-        return self.decode(loads(blob))
+    def loads(self, blob, zero_copy=False):
+        return loads(blob, zero_copy=zero_copy, tag_hook=self._decode_hook)
 
 
 class WrappedCBOR(ClassTag):
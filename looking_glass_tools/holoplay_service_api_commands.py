@@ -16,66 +16,139 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
-def hide():
-    obj = {
+# The commands always have the same shape, so everything but the variable fields is
+# encoded to CBOR once, the first time a command is built, which keeps the cbor package
+# out of add-on registration. The builders return dicts that cbor.dumps encodes from these.
+
+_templates = None
+
+def _template(name):
+    global _templates
+    if _templates == None:
+        _templates = _compile_templates()
+    return _templates[name]
+
+def _compile_templates():
+    from . cbor import Template, Slot
+
+    templates = {}
+
+    templates['hide'] = Template({
         'cmd': {
             'hide': {},
         },
         'bin': bytes(),
-    }
-    return obj
+    })
 
-def wipe():
-    obj = {
+    templates['wipe'] = Template({
         'cmd': {
             'wipe': {},
         },
         'bin': bytes(),
-    }
-    return obj
+    })
 
-def load_quilt(name, settings = 0):
-    obj = {
+    templates['load_quilt'] = Template({
         'cmd': {
             'show': {
                 'source': 'cache',
                 'quilt': {
-                    'name': name
+                    'name': Slot('name')
                 },
             },
         },
         'bin': bytes(),
-    }
-    if (settings != 0):
-        obj['cmd']['show']['quilt']['settings'] = settings
-    return obj
+    })
 
-def show_quilt(bindata, settings):
-    obj = {
+    templates['load_quilt_with_settings'] = Template({
         'cmd': {
             'show': {
-                'source': 'bindata',
+                'source': 'cache',
                 'quilt': {
-                    'type': 'image',
-                    'settings': settings
-                }
+                    'name': Slot('name'),
+                    'settings': Slot('settings')
+                },
             },
         },
-        'bin': bindata,
-    }
-    return obj
+        'bin': bytes(),
+    })
 
-def cache_quilt(bindata, name, settings):
-    obj = {
-        'cmd': {
-            'cache': {
-                'quilt': {
-                    'name': name,
-                    'type': 'image',
-                    'settings': settings
+    def show_quilt_template(quilt_type, with_format):
+        quilt = {
+            'type': quilt_type,
+            'settings': Slot('settings')
+        }
+        if with_format:
+            quilt['format'] = Slot('format')
+        return Template({
+            'cmd': {
+                'show': {
+                    'source': 'bindata',
+                    'quilt': quilt
+                },
+            },
+            'bin': Slot('bin'),
+        })
+
+    def cache_quilt_template(quilt_type, with_format):
+        quilt = {
+            'name': Slot('name'),
+            'type': quilt_type,
+            'settings': Slot('settings')
+        }
+        if with_format:
+            quilt['format'] = Slot('format')
+        return Template({
+            'cmd': {
+                'cache': {
+                    'quilt': quilt
                 }
-            }
-        },
-        'bin': bindata,
+            },
+            'bin': Slot('bin'),
+        })
+
+    templates['show_quilt'] = show_quilt_template('image', False)
+    templates['show_raw_quilt'] = show_quilt_template('raw', True)
+    templates['cache_quilt'] = cache_quilt_template('image', False)
+    templates['cache_raw_quilt'] = cache_quilt_template('raw', True)
+
+    templates['quilt_settings'] = Template({'vx': Slot('vx'), 'vy': Slot('vy'), 'vtotal': Slot('vtotal'), 'aspect': Slot('aspect')})
+
+    return templates
+
+def make_quilt_settings(vx, vy, aspect):
+    """ quilt settings for show_quilt, cache_quilt and load_quilt, encoded from a template """
+    return _template('quilt_settings').fill(vx=vx, vy=vy, vtotal=vx*vy, aspect=aspect)
+
+def hide():
+    return _template('hide').fill()
+
+def wipe():
+    return _template('wipe').fill()
+
+def load_quilt(name, settings = 0):
+    if (settings != 0):
+        return _template('load_quilt_with_settings').fill(name=name, settings=settings)
+    return _template('load_quilt').fill(name=name)
+
+def raw_quilt_format(width, height, channels=4, flip_y=False):
+    """ describes raw quilt pixels: rows stored top-down, `channels` bytes per pixel (4 = RGBA, 3 = RGB), `stride` bytes per row.
+    With `flip_y` the rows are stored bottom-up and the service flips them """
+    raw_format = {
+        'width': width,
+        'height': height,
+        'channels': channels,
+        'stride': width * channels,
     }
-    return obj
+    if flip_y:
+        raw_format['flipY'] = True
+    return raw_format
+
+def show_quilt(bindata, settings, raw_format = None):
+    if (raw_format != None):
+        return _template('show_raw_quilt').fill(bin=bindata, settings=settings, format=raw_format)
+    return _template('show_quilt').fill(bin=bindata, settings=settings)
+
+def cache_quilt(bindata, name, settings, raw_format = None):
+    if (raw_format != None):
+        return _template('cache_raw_quilt').fill(bin=bindata, name=name, settings=settings, format=raw_format)
+    return _template('cache_quilt').fill(bin=bindata, name=name, settings=settings)
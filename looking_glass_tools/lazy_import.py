@@ -0,0 +1,39 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+import importlib
+
+class LazyModule(object):
+    """ Stands in for a module that is imported the first time one of its attributes is used.
+    Looked up attributes are kept on the stand-in, so later uses cost no more than on the module """
+
+    def __init__(self, name):
+        self.__name = name
+
+    def __getattr__(self, attr):
+        # only called for attributes not looked up before, the import itself is thread-safe
+        value = getattr(importlib.import_module(self.__name), attr)
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return "<lazily imported module '" + self.__name + "'>"
+
+def lazy_import(name):
+    """ like `import name`, but the module is only loaded once it is used, so heavy modules stay out of add-on registration """
+    return LazyModule(name)
@@ -24,7 +24,6 @@ import timeit # only for benchmarking
 import os
 import ctypes
 import sys
-import numpy as np
 from bgl import *
 from math import *
 from mathutils import *
@@ -33,10 +32,14 @@ from bpy.props import FloatProperty, PointerProperty, BoolProperty, StringProper
 from bpy_extras.io_utils import ExportHelper
 from gpu_extras.presets import draw_texture_2d
 from gpu_extras.batch import batch_for_shader
+from . lazy_import import lazy_import
 from . import looking_glass_settings
 from . looking_glass_settings import *
 from . holoplay_service_api_commands import *
 
+# numpy is loaded when the first quilt is read back, not when the addon is registered
+np = lazy_import("numpy")
+
 # HoloPlayCore will be loaded into this
 #hp = None
 
@@ -55,10 +58,18 @@ hp_imgDataBlockQuilt = None
 hp_FBO = None
 hp_FBO_tmp = None
 hp_FBO_img = None
+hp_flipQuilt = None
+hp_FBO_flip = None
+hp_FBO_flipSource = None
 hpc_LightfieldVertShaderGLSL = None
 hpc_LightfieldFragShaderGLSL = None
 sock = None
 
+# offscreens survive across operator calls, keyed by (viewX, viewY, number of offscreens)
+hp_offscreenPool = {}
+hp_offscreenPoolHits = 0
+hp_offscreenPoolMisses = 0
+
 class OffScreenDraw(bpy.types.Operator):
 	''' Manages drawing of the looking glass live view '''
 	bl_idname = "view3d.offscreen_draw"
@@ -158,6 +169,25 @@ class OffScreenDraw(bpy.types.Operator):
 		if hp_FBO == None:
 			hp_FBO = self.setupBuffers(hp_FBO, hp_myQuilt)
 
+		if len(offscreens) == 1 and len(modelview_matrices) > 1:
+			# single offscreen mode: every view is drawn into the same offscreen and copied into its tile
+			# before the next view is drawn, so VRAM usage does not depend on the number of views
+			offscreen = offscreens[0]
+			for view in range(len(modelview_matrices)):
+				with offscreen.bind():
+					offscreen.draw_view3d(
+						scene,
+						context.view_layer,
+						context.space_data,
+						context.region,
+						modelview_matrices[view],
+						projection_matrices[view],
+						)
+				# rebinding before the copy is the same workaround for https://developer.blender.org/T84402 as below
+				with offscreen.bind():
+					OffScreenDraw._copy_offscreen_to_quilt(view)
+			return
+
 		for view, offscreen in enumerate(offscreens):
 			with offscreen.bind():
 				# start_time = timeit.default_timer()
@@ -175,27 +205,32 @@ class OffScreenDraw(bpy.types.Operator):
 		for view, offscreen in enumerate(offscreens):
 			with offscreen.bind():
 				# start_time = timeit.default_timer()
-				glReadBuffer(GL_BACK)
-				glBindTexture(GL_TEXTURE_2D, hp_myQuilt[0])
-				x = int((view % qs_columns) * qs_viewWidth)
-				y = int(floor(view / qs_columns) * qs_viewHeight)
+				OffScreenDraw._copy_offscreen_to_quilt(view)
+				# print("Copying to quilt: %.6f" % (timeit.default_timer() - start_time))
 
-				''' glCopyTexSubImage2D works like a direct call to glReadPixels, saves one step '''
-				# glCopyTexSubImage2D(GL_TEXTURE_2D, 0, x, y, 0, 0,
-				# 					qs_viewWidth, qs_viewHeight)
+	@staticmethod
+	def _copy_offscreen_to_quilt(view):
+		''' copies the currently bound offscreen into the tile of the quilt that belongs to view '''
+		glReadBuffer(GL_BACK)
+		glBindTexture(GL_TEXTURE_2D, hp_myQuilt[0])
+		x = int((view % qs_columns) * qs_viewWidth)
+		y = int(floor(view / qs_columns) * qs_viewHeight)
 
-				''' alternate implementation using glBlitFramebuffer() '''
-				old_draw_framebuffer = Buffer(GL_INT, 1)
-				glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING, old_draw_framebuffer)
+		''' glCopyTexSubImage2D works like a direct call to glReadPixels, saves one step '''
+		# glCopyTexSubImage2D(GL_TEXTURE_2D, 0, x, y, 0, 0,
+		# 					qs_viewWidth, qs_viewHeight)
 
-				glBindFramebuffer(GL_DRAW_FRAMEBUFFER, hp_FBO[0])
+		''' alternate implementation using glBlitFramebuffer() '''
+		old_draw_framebuffer = Buffer(GL_INT, 1)
+		glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING, old_draw_framebuffer)
 
-				glBlitFramebuffer(0, 0, qs_viewWidth, qs_viewHeight,
-							x, y, x+qs_viewWidth, y+qs_viewHeight,
-							GL_COLOR_BUFFER_BIT, GL_LINEAR)
+		glBindFramebuffer(GL_DRAW_FRAMEBUFFER, hp_FBO[0])
 
-				glBindFramebuffer(GL_DRAW_FRAMEBUFFER, old_draw_framebuffer[0])
-				# print("Copying to quilt: %.6f" % (timeit.default_timer() - start_time))
+		glBlitFramebuffer(0, 0, qs_viewWidth, qs_viewHeight,
+					x, y, x+qs_viewWidth, y+qs_viewHeight,
+					GL_COLOR_BUFFER_BIT, GL_LINEAR)
+
+		glBindFramebuffer(GL_DRAW_FRAMEBUFFER, old_draw_framebuffer[0])
 
 	def _setup_matrices_from_existing_cameras(self, context, cam_parent):
 		modelview_matrices = []
@@ -409,6 +444,70 @@ class OffScreenDraw(bpy.types.Operator):
 		else:
 			return offscreens
 
+	@staticmethod
+	def get_pooled_offscreens(context, num_offscreens):
+		''' Returns a list of num_offscreens off-screen buffers from the pool, allocating them only when the view settings changed '''
+		global hp_offscreenPoolHits
+		global hp_offscreenPoolMisses
+
+		wm = context.window_manager
+		key = (wm.viewX, wm.viewY, num_offscreens)
+
+		offscreens = hp_offscreenPool.get(key)
+		if offscreens is not None:
+			hp_offscreenPoolHits += 1
+			return offscreens
+		hp_offscreenPoolMisses += 1
+
+		# evict everything that was allocated for a different view resolution or view count
+		total_views = wm.tileX * wm.tileY
+		for stale_key in list(hp_offscreenPool.keys()):
+			if stale_key[:2] != key[:2] or stale_key[2] not in (1, total_views):
+				OffScreenDraw._free_offscreens(hp_offscreenPool.pop(stale_key))
+
+		offscreens = OffScreenDraw._setup_offscreens(context, num_offscreens)
+		if num_offscreens == 1:
+			offscreens = [offscreens]
+		# do not keep failed allocations around, the next call should retry
+		if None not in offscreens:
+			hp_offscreenPool[key] = offscreens
+		print("Offscreen pool miss for " + str(key) + ", hits: " + str(hp_offscreenPoolHits) + " misses: " + str(hp_offscreenPoolMisses))
+		return offscreens
+
+	@staticmethod
+	def get_render_offscreens(context):
+		''' Returns the offscreens used to render the quilt, a single one when single offscreen rendering is enabled '''
+		wm = context.window_manager
+		if wm.singleOffscreen:
+			offscreens = OffScreenDraw.get_pooled_offscreens(context, 1)
+			if offscreens[0] is not None:
+				return offscreens
+			print("Single offscreen rendering is not supported, falling back to one offscreen per view")
+		return OffScreenDraw.get_pooled_offscreens(context, wm.tileX * wm.tileY)
+
+	@staticmethod
+	def _free_offscreens(offscreens):
+		for offscreen in offscreens:
+			if offscreen is not None:
+				offscreen.free()
+
+	@staticmethod
+	def free_offscreen_pool():
+		''' Releases all pooled off-screen buffers, called when the addon is unregistered '''
+		global hp_offscreenPool
+		for offscreens in hp_offscreenPool.values():
+			OffScreenDraw._free_offscreens(offscreens)
+		hp_offscreenPool = {}
+
+	@staticmethod
+	def offscreen_pool_stats():
+		''' Returns the hit/miss counters and the number of resident off-screen buffers of the pool '''
+		return {
+			'hits': hp_offscreenPoolHits,
+			'misses': hp_offscreenPoolMisses,
+			'offscreens': sum(len(offscreens) for offscreens in hp_offscreenPool.values()),
+		}
+
 	@staticmethod
 	def _setup_matrices_from_camera(context, camera):
 		scene = context.scene
@@ -623,18 +722,72 @@ class OffScreenDraw(bpy.types.Operator):
 		glGetTexImage(GL_TEXTURE_2D, 0, GL_RGBA, GL_UNSIGNED_BYTE, bufferForQuilt)
 		glBindTexture(GL_TEXTURE_2D, 0)
 
-		if hp_imgDataBlockQuilt == None:
-			hp_imgDataBlockQuilt = bpy.data.images.new("hp_imgDataBlockQuilt", qs_width, qs_height, float_buffer=True)
-
-		# bottleneck
 		start_time = timeit.default_timer()
-		imageDataNp = np.empty(qs_width * qs_height * 4, dtype=np.uint8)
-		buffer_list = bytes(bufferForQuilt.to_list())
-		imageDataNp = np.frombuffer(buffer_list, dtype=np.uint8)
+		imageDataNp = OffScreenDraw.buffer_to_uint8_array(bufferForQuilt)
 		print("Copying from buffer into np array took: %.6f" % (timeit.default_timer() - start_time))
 
 		return imageDataNp
 
+	@staticmethod
+	def buffer_to_uint8_array(buffer):
+		"""return the bytes of a bgl.Buffer as uint8 numpy array
+
+		bgl.Buffer supports the buffer protocol, so the array is a view of the buffer memory
+		that keeps the buffer alive and no Python object is created per pixel. Older bgl
+		versions without the buffer protocol go through the slow list conversion.
+		"""
+		try:
+			return np.frombuffer(buffer, dtype=np.uint8)
+		except TypeError:
+			# bgl only knows signed bytes, reinterpret them as the unsigned values GL wrote
+			return np.array(buffer.to_list(), dtype=np.int8).view(np.uint8)
+
+	@staticmethod
+	def benchmark_buffer_to_uint8_array(width=4096, height=4096, repeat=3):
+		''' Prints how long the old list round-trip and the buffer view take for a width x height RGBA quilt '''
+		bufferForQuilt = Buffer(GL_BYTE, width * height * 4)
+		for i in range(repeat):
+			start_time = timeit.default_timer()
+			np.array(bufferForQuilt.to_list(), dtype=np.int8).view(np.uint8)
+			list_time = timeit.default_timer() - start_time
+
+			start_time = timeit.default_timer()
+			OffScreenDraw.buffer_to_uint8_array(bufferForQuilt)
+			view_time = timeit.default_timer() - start_time
+			print("Quilt %dx%d to numpy, list round-trip: %.6f buffer view: %.6f" % (width, height, list_time, view_time))
+
+	@staticmethod
+	def flip_quilt_texture(quiltTexture):
+		''' Blits the quilt upside down into a staging texture so its readback starts with the top row, returns the staging texture '''
+		global hp_flipQuilt
+		global hp_FBO_flip
+		global hp_FBO_flipSource
+
+		if hp_flipQuilt == None:
+			hp_flipQuilt = OffScreenDraw.setupMyQuilt(hp_flipQuilt)
+			hp_FBO_flip = OffScreenDraw.setupBuffers(hp_FBO_flip, hp_flipQuilt)
+		if hp_FBO_flipSource == None:
+			hp_FBO_flipSource = Buffer(GL_INT, 1)
+			glGenFramebuffers(1, hp_FBO_flipSource)
+
+		old_read_framebuffer = Buffer(GL_INT, 1)
+		glGetIntegerv(GL_READ_FRAMEBUFFER_BINDING, old_read_framebuffer)
+		old_draw_framebuffer = Buffer(GL_INT, 1)
+		glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING, old_draw_framebuffer)
+
+		glBindFramebuffer(GL_READ_FRAMEBUFFER, hp_FBO_flipSource[0])
+		glFramebufferTexture(GL_READ_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, quiltTexture, 0)
+		glBindFramebuffer(GL_DRAW_FRAMEBUFFER, hp_FBO_flip[0])
+
+		# swapping the destination rows lets the GPU do the flip
+		glBlitFramebuffer(0, 0, qs_width, qs_height,
+					  0, qs_height, qs_width, 0,
+					  GL_COLOR_BUFFER_BIT, GL_NEAREST)
+
+		glBindFramebuffer(GL_READ_FRAMEBUFFER, old_read_framebuffer[0])
+		glBindFramebuffer(GL_DRAW_FRAMEBUFFER, old_draw_framebuffer[0])
+		return hp_flipQuilt[0]
+
 	@staticmethod
 	def update_image(tex_id, target=GL_RGBA, texture=GL_TEXTURE0):
 		"""copy the current buffer to the image"""
@@ -756,11 +909,10 @@ class looking_glass_send_quilt_to_holoplay_service(bpy.types.Operator):
 		start_time = timeit.default_timer()
 
 		sock = looking_glass_settings.sock
-		if sock == None:
+		if sock == None or looking_glass_settings.sender == None:
 			self.report({"ERROR"}, "Could not connect to socket, aborting.")
 			return {"CANCELLED"}
 
-		qs_totalViews = wm.tileX * wm.tileY
 		od = OffScreenDraw
 		if hp_myQuilt == None:
 			hp_myQuilt = od.setupMyQuilt(hp_myQuilt)
@@ -773,19 +925,28 @@ class looking_glass_send_quilt_to_holoplay_service(bpy.types.Operator):
 				self.report({"WARNING"}, "Sending a rendered image from Viewer Node to HoloPlay Service is not supported yet. Please save the image to disk and load the first image of the multiview sequence.")
 				return {"CANCELLED"}
 			quilt = od.create_quilt_from_holoplay_multiview_image(od, context)
+			top_down = False
 		else:
-			offscreens = od._setup_offscreens(context, qs_totalViews)
+			offscreens = od.get_render_offscreens(context)
 			print("Setting up HoloPlay Service took: %.6f" % (timeit.default_timer() - start_time))
 			start_time_offscreendraw = timeit.default_timer()
 			od.draw_3dview_into_texture(od, context, offscreens)
 			print("Drawing into offscreens took: %.6f" % (timeit.default_timer() - start_time_offscreendraw))
 			start_time_quiltcopy = timeit.default_timer()
-			quilt = od.copy_quilt_from_texture_to_image_datablock(hp_myQuilt[0])
-			# quilt = od.copy_quilt_from_texture_to_numpy_array(hp_myQuilt[0])
+			# quilt = od.copy_quilt_from_texture_to_image_datablock(hp_myQuilt[0])
+			# let the GPU flip the quilt when the transport wants the top row first
+			top_down = looking_glass_settings.quilt_wants_top_down()
+			quiltTexture = od.flip_quilt_texture(hp_myQuilt[0]) if top_down else hp_myQuilt[0]
+			quilt = od.copy_quilt_from_texture_to_numpy_array(quiltTexture)
 			print("Copying quilt into np array took: %.6f" % (timeit.default_timer() - start_time_quiltcopy))
-		send_quilt(sock, quilt, duration=int(7))
-		# send_quilt_from_np(sock, quilt, duration=int(7))
-		print("Done.")
+		# both the multiview images and the 3D view end up as uint8 numpy arrays,
+		# encoding and sending happens on the sender thread so the UI does not wait for the service
+		future = looking_glass_settings.submit_quilt(quilt, top_down=top_down)
+		if future.cancelled():
+			self.report({"WARNING"}, "HoloPlay Service is still busy with earlier quilts, this one was dropped.")
+			return {'CANCELLED'}
+		# the outcome arrives later, failures are shown in the panel
+		self.report({"INFO"}, "Quilt queued for sending.")
 		return {'FINISHED'}
 
 class looking_glass_save_quilt_as_image(bpy.types.Operator, ExportHelper):
@@ -820,7 +981,6 @@ class looking_glass_save_quilt_as_image(bpy.types.Operator, ExportHelper):
 		wm = bpy.context.window_manager
 		start_time = timeit.default_timer()
 
-		qs_totalViews = wm.tileX * wm.tileY
 		od = OffScreenDraw
 		if hp_myQuilt == None:
 			hp_myQuilt = od.setupMyQuilt(hp_myQuilt)
@@ -834,7 +994,7 @@ class looking_glass_save_quilt_as_image(bpy.types.Operator, ExportHelper):
 				return {"CANCELLED"}
 			quilt = od.create_quilt_from_holoplay_multiview_image(od, context)
 		else:
-			offscreens = od._setup_offscreens(context, qs_totalViews)
+			offscreens = od.get_render_offscreens(context)
 			print("Setting up HoloPlay Service took: %.6f" % (timeit.default_timer() - start_time))
 			start_time_offscreendraw = timeit.default_timer()
 			od.draw_3dview_into_texture(od, context, offscreens)
@@ -856,6 +1016,7 @@ def register():
 	bpy.types.IMAGE_MT_view.append(menu_func)
 
 def unregister():
+	OffScreenDraw.free_offscreen_pool()
 	bpy.utils.unregister_class(looking_glass_send_quilt_to_holoplay_service)
 	bpy.utils.unregister_class(OffScreenDraw)
 	bpy.types.IMAGE_MT_view.remove(menu_func)
@@ -16,45 +16,204 @@
 #
 # ##### END GPL LICENSE BLOCK #####
 
-import ctypes
 import sys
+import os
+import json
 import bpy
-import time
-import io
-import numpy as np
+import hashlib
 import timeit
+import threading
+import queue
+from collections import OrderedDict, deque
+from concurrent.futures import Future
 from . holoplay_service_api_commands import *
-from . import cbor
-from . import cffi
+from . lazy_import import lazy_import
+from . quilt_encoding import encode_quilt_bmp, encode_quilt_raw
+
+# numpy is loaded when the first quilt is read or sent, not when the addon is registered
+np = lazy_import("numpy")
 
 hardwareVersion = None
+# QuiltSender owning the socket once init() connected to HoloPlay Service
+sender = None
+# 3 drops the alpha channel the Looking Glass does not use, 4 sends RGBA
+rawQuiltChannels = 3
+# send raw quilts bottom-up and let HoloPlay Service flip them instead of flipping them on the GPU
+serviceFlipsQuilt = False
+# send every quilt once with cache_quilt and show it with load_quilt, so showing a known quilt again costs only a few bytes.
+# Off by default, as every cached quilt takes a full resolution image of memory in HoloPlay Service
+useQuiltCache = False
+# number of quilts HoloPlay Service keeps cached for us, each lives under one slot name
+quiltCacheSize = 4
+# content hash -> slot name of the cached quilts, least recently used first
+quiltCache = OrderedDict()
+quiltCacheHits = 0
+quiltCacheMisses = 0
+# whether building the C accelerator of the cbor package was tried in this session
+cborAcceleratorTried = False
+# pip names of the dependencies init() did not find, looking_glass_install_dependencies installs them
+missingPackages = []
+# last line pip printed while looking_glass_install_dependencies runs, None otherwise
+installStatus = None
+# why the last quilt sent through the sender thread failed, None when it was shown
+lastSendError = None
+# pynng socket connected to HoloPlay Service by init(), None until then
+sock = None
+numDevices = 0
+# "disconnected", "connecting", "connected" or "failed", shown in the panel while init() runs in the background
+connectionState = "disconnected"
+# seconds each stage of the last init() took, in order
+initTimings = OrderedDict()
+initStartTime = 0.0
+# result of the background part of init() until _poll_init applies it on the main thread
+_initFuture = None
+
+# (<import name>, <pip name>) of the packages the addon needs besides Blender's own
+DEPENDENCIES = [
+    ("pynng","pynng"),
+    ("PIL", "Pillow")
+]
+
+def python_binary():
+    if bpy.app.version < (2,91,0):
+        return bpy.app.binary_path_python
+    return sys.executable
+
+def dependency_manifest_path():
+    """ JSON file remembering where the dependencies were found, in the addon's config directory.
+    Uses bpy, so it is called on the main thread and the path handed to check_site_packages """
+    config_dir = bpy.utils.user_resource('CONFIG', path="looking_glass_tools", create=True)
+    return os.path.join(config_dir, "dependencies.json")
+
+def _read_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _manifest_valid(manifest, packages):
+    """ the manifest holds as long as Python is the same and every module file is unchanged where it was found """
+    if manifest == None or manifest.get('python') != sys.version:
+        return False
+    found = manifest.get('packages', {})
+    for import_name, pip_name in packages:
+        entry = found.get(import_name)
+        if entry == None or entry['path'] not in sys.path:
+            return False
+        try:
+            if os.stat(entry['origin']).st_mtime != entry['mtime']:
+                return False
+        except OSError:
+            return False
+    return True
+
+def _package_version(pip_name):
+    try:
+        from importlib import metadata
+        return metadata.version(pip_name)
+    except Exception:
+        return None
 
-def ensure_site_packages(packages):
-    """ `packages`: list of tuples (<import name>, <pip name>) """
+def check_site_packages(packages, manifest_path):
+    """ `packages`: list of tuples (<import name>, <pip name>). Returns the pip names of the packages that cannot be imported.
+    What was found is written to the manifest at `manifest_path`, so while nothing changes later startups only stat a few
+    files instead of searching sys.path. Nothing is installed here, see looking_glass_install_dependencies """
 
     if not packages:
-        return
+        return []
 
     import site
+
+    user_site = site.getusersitepackages()
+    if user_site not in sys.path:
+        sys.path.append(user_site)
+
+    if _manifest_valid(_read_manifest(manifest_path), packages):
+        return []
+
     import importlib.util
 
-    sys.path.append(site.getusersitepackages())
+    found = {}
+    missing = []
+    for import_name, pip_name in packages:
+        spec = importlib.util.find_spec(import_name)
+        if spec == None or spec.origin == None:
+            missing.append(pip_name)
+            continue
+        # the sys.path entry the package lives in, it must still be there for the manifest to hold
+        path = os.path.dirname(spec.origin)
+        if spec.submodule_search_locations:
+            path = os.path.dirname(path)
+        found[import_name] = {
+            'origin': spec.origin,
+            'mtime': os.stat(spec.origin).st_mtime,
+            'path': path,
+            'version': _package_version(pip_name),
+        }
+
+    if not missing:
+        try:
+            with open(manifest_path, 'w') as f:
+                json.dump({'python': sys.version, 'packages': found}, f, indent=1)
+        except OSError as e:
+            print("Could not write the dependency manifest: " + str(e))
+    return missing
+
+def ensure_cbor_accelerator():
+    """ switches the cbor package to its optional C part. That is compiled with the cffi and pycparser that come with pynng
+    by looking_glass_install_dependencies. When the dependencies were there before and a C compiler is available, it is
+    built here on its own thread instead. Messages are encoded with the pure Python codec until cbor.use_accelerator()
+    switches over, and that stays in use if anything fails """
+    global cborAcceleratorTried
 
-    modules_to_install = [module[1] for module in packages if not importlib.util.find_spec(module[0])]
+    from . import cbor
 
-    if modules_to_install:
-        import subprocess
+    if cbor.accelerated or cborAcceleratorTried:
+        return
+    cborAcceleratorTried = True
 
-        if bpy.app.version < (2,91,0):
-            python_binary = bpy.app.binary_path_python
-        else:
-            python_binary = sys.executable
+    from .cbor import _cbor_build
+
+    path = _cbor_build.extension_path()
+    if path is not None:
+        # built at install time
+        _switch_to_cbor_accelerator(path)
+        return
+    if not _cbor_build.have_compiler():
+        print("No C compiler found, using the pure Python CBOR codec")
+        return
+
+    thread = threading.Thread(target=_build_cbor_accelerator, name="CBOR accelerator build")
+    thread.daemon = True
+    thread.start()
+
+def _build_cbor_accelerator():
+    from .cbor import _cbor_build
+
+    start_time = timeit.default_timer()
+    try:
+        path = _cbor_build.build()
+    except Exception as e:
+        print("Building the CBOR accelerator failed, using the pure Python codec: " + str(e))
+        return
+    print("Building the CBOR accelerator took: %.6f" % (timeit.default_timer() - start_time))
+    _switch_to_cbor_accelerator(path)
+
+def _switch_to_cbor_accelerator(path):
+    """ uses the extension at `path` once it gives the same results as the pure Python codec, removes it otherwise """
+    from . import cbor
 
-        subprocess.run([python_binary, '-m', 'ensurepip'], check=True)
-        subprocess.run([python_binary, '-m', 'pip', 'install', *modules_to_install, "--user"], check=True)
+    try:
+        from .cbor import _cbor
+        print("CBOR accelerator matches the Python codec on %d items" % _cbor.check_parity())
+    except Exception as e:
+        print("CBOR accelerator does not work, using the pure Python codec: " + repr(e))
+        os.remove(path)
+        return
+    cbor.use_accelerator()
 
 def send_message(sock, inputObj):
-    import pynng
     from . import cbor
 
     out = cbor.dumps(inputObj)
@@ -71,142 +230,432 @@ def send_message(sock, inputObj):
     print("---------------")
     return response_load
 
-def send_quilt(sock, quilt, duration=10):
-    print("===================================================")
-    print("Sending quilt to HoloPlay Service")
-
-    wm = bpy.context.window_manager
-    aspect = wm.aspect
-    W = wm.quiltX
-    H = wm.quiltY
-    vx = wm.tileX
-    vy = wm.tileY
-    vtotal = vx*vy
-
-    from PIL import Image, ImageOps
-
-    start_time = timeit.default_timer()
-    print("Show a single quilt for " + str(duration) + " seconds, then wipe.")
-    print("===================================================")
-
-    # we need to get the data from a Blender image datablock because this is where we would put the image aquired from OpenGL
-    # in the live view solution
-    img0 = quilt
-    W,H = img0.size
+def quilt_pixels_from_image(img):
+    """ reads a Blender image datablock into a uint8 RGBA numpy array, returns (pixels, W, H) """
+    W,H = img.size
 
     # pre-allocate numpy array for better performance
-    px0 = np.zeros(H*W*4, dtype=np.float32)
+    px0 = np.empty(H*W*4, dtype=np.float32)
     # foreach_get is probably the fastest method to aquire the pixel values from a Blender image datablock
-    img0.pixels.foreach_get(px0)
-    print("Reading image from Blender image datablock: %.6f" % (timeit.default_timer() - start_time))
-
-    # we need to convert the floats to integers from 0-255 for most image formats like PNG or BMP which can be send to HoloPlay Service
-    # np.multiply(px0, 255, out=px0, casting="unsafe")
-    px0 = px0 * 255
-    pixels=px0.astype(np.uint8, order="C")
-
-    pimg_time = timeit.default_timer()
-    # for some reason the following only works when we create a PIL Image from a bytes-stream
-    # so we need to convert the numpy array to bytes and read that
-    pimg = Image.frombytes("RGBA", (W,H),  pixels.tobytes())
-
-    # the result is flipped, probably due to numpy, flip it back
-    pimg_flipped = ImageOps.flip(pimg)
-    print("Converting pixels to bytes-stream and flipping took: %.6f" % (timeit.default_timer() - pimg_time))
-
-    # the idea is that we convert the PIL image to a simple file format HoloPlay Service / stb_image can read
-    # and store it in a BytesIO object instead of disk
-    output = io.BytesIO()
-    pimg_flipped.convert('RGBA').save(output, 'BMP')
-
-    # the contents of the BytesIO object becomes our blob we send to HoloPlay Service
-    blob = output.getvalue()
-    settings = {'vx': vx,'vy': vy,'vtotal': vtotal,'aspect': aspect}
-    send_message(sock, show_quilt(blob, settings))
-    print("Reading quilt from Blender image datablock and sending it to HoloPlay Service took: %.6f" % (timeit.default_timer() - start_time))
-
-# def send_quilt_from_np(sock, quilt, W=4096, H=4096, duration=10):
-def send_quilt_from_np(sock, quilt, W=4096, H=4096, duration=10):
-    print("===================================================")
-    print("Sending quilt to HoloPlay Service")
+    img.pixels.foreach_get(px0)
+
+    # we need to convert the floats to integers from 0-255 which can be send to HoloPlay Service
+    np.multiply(px0, 255, out=px0)
+    return px0.astype(np.uint8), W, H
 
+def quilt_settings():
+    wm = bpy.context.window_manager
+    return make_quilt_settings(wm.tileX, wm.tileY, wm.aspect)
+
+def raw_quilts_enabled():
+    """ whether the user turned on the experimental raw transport. HoloPlay Service does not report whether it accepts
+    raw quilts, so it is never turned on by itself. Reads the window manager, so only call it on the main thread """
+    return bpy.context.window_manager.rawQuiltTransport
+
+def quilt_wants_top_down():
+    """ whether the quilt should be read back with the top row first, which only the raw transport needs """
+    return raw_quilts_enabled() and not serviceFlipsQuilt
+
+def encode_quilt(pixels, W, H, top_down=False, raw=False):
+    """ encodes the pixels as BMP, or with `raw` as raw pixels. Returns (blob, raw_format or None, transport name) """
+    if raw:
+        blob, raw_format = encode_quilt_raw(pixels, W, H, rawQuiltChannels, top_down, serviceFlipsQuilt)
+        return blob, raw_format, "raw"
+    # BMP can store the rows either way, so it never needs a flip
+    return encode_quilt_bmp(pixels, W, H, top_down), None, "BMP"
+
+def response_ok(response):
+    """ HoloPlay Service reports failed commands with a non-zero 'error' """
+    return response != None and not response.get('error')
+
+def clear_quilt_cache(wipe_service=False):
+    """ forgets all cached quilts, with `wipe_service` HoloPlay Service drops them too. While the sender thread runs it
+    owns the socket and the cache, so the clearing is queued there and a Future of it returned """
+    if sender == None:
+        quiltCache.clear()
+        return None
+    return sender.submit(_clear_quilt_cache_job, wipe_service)
+
+def _clear_quilt_cache_job(sock, wipe_service):
+    quiltCache.clear()
+    if wipe_service:
+        return send_message(sock, wipe())
+    return None
+
+def quilt_cache_key(blob, settings, raw_format=None):
+    """ hash of the encoded quilt and everything that changes how the service shows it """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr(sorted(settings.items())).encode('utf8'))
+    if raw_format != None:
+        h.update(repr(sorted(raw_format.items())).encode('utf8'))
+    h.update(blob)
+    return h.hexdigest()
+
+def send_cached_quilt(sock, blob, settings, raw_format=None):
+    """ shows the quilt from the service side cache, caching it first when it has not been sent before """
+    global quiltCacheHits
+    global quiltCacheMisses
+
+    key = quilt_cache_key(blob, settings, raw_format)
+    name = quiltCache.get(key)
+    if name != None:
+        quiltCache.move_to_end(key)
+        response = send_message(sock, load_quilt(name, settings))
+        if response_ok(response):
+            quiltCacheHits += 1
+            return response
+        # the service lost the quilt, e.g. because it was restarted
+        del quiltCache[key]
+    quiltCacheMisses += 1
+
+    if len(quiltCache) >= quiltCacheSize:
+        # the least recently used quilt gives up its slot, caching the new quilt under the same name
+        # replaces it on the service side, so the service never holds more than quiltCacheSize of our quilts
+        evicted_key, name = quiltCache.popitem(last=False)
+    else:
+        used_names = set(quiltCache.values())
+        name = next(slot for slot in ("blender_quilt_" + str(i) for i in range(quiltCacheSize)) if slot not in used_names)
+
+    response = send_message(sock, cache_quilt(blob, name, settings, raw_format))
+    if not response_ok(response):
+        return response
+    quiltCache[key] = name
+    return send_message(sock, load_quilt(name, settings))
+
+def send_quilt_pixels(sock, pixels, W, H, settings, top_down=False, raw=False):
+    """ sends W*H uint8 RGBA pixels to HoloPlay Service, the single pipeline behind send_quilt and send_quilt_from_np """
+    start_time = timeit.default_timer()
+    blob, raw_format, transport = encode_quilt(pixels, W, H, top_down, raw)
+    encode_time = timeit.default_timer()
+    print("Encoding quilt as %s took: %.6f" % (transport, encode_time - start_time))
+
+    if useQuiltCache:
+        response = send_cached_quilt(sock, blob, settings, raw_format)
+        print("Quilt cache hits: " + str(quiltCacheHits) + " misses: " + str(quiltCacheMisses))
+    else:
+        response = send_message(sock, show_quilt(blob, settings, raw_format))
+    print("Sending quilt to HoloPlay Service took: %.6f" % (timeit.default_timer() - encode_time))
+    return response
+
+def benchmark_quilt_transports(sock=None, W=4096, H=4096, repeat=3):
+    """ prints encode (and with `sock` also send) times of the BMP and raw transports for a W*H quilt """
+    pixels = np.random.randint(0, 256, W*H*4, dtype=np.uint8)
+    settings = quilt_settings()
+    for i in range(repeat):
+        for transport in ("BMP", "raw"):
+            start_time = timeit.default_timer()
+            if transport == "BMP":
+                blob, raw_format = encode_quilt_bmp(pixels, W, H), None
+            else:
+                blob, raw_format = encode_quilt_raw(pixels, W, H, rawQuiltChannels, service_flips=serviceFlipsQuilt)
+            encode_time = timeit.default_timer()
+            send_time = 0.0
+            # sending a raw quilt to a service that does not support it only returns an error
+            if sock != None and (transport == "BMP" or raw_quilts_enabled()):
+                send_message(sock, show_quilt(blob, settings, raw_format))
+                send_time = timeit.default_timer() - encode_time
+            print("%s quilt, %d bytes, encode: %.6f send: %.6f" % (transport, len(blob), encode_time - start_time, send_time))
+
+class QuiltSender(object):
+    """ Owns the HoloPlay Service socket on a worker thread, so sending a quilt never blocks Blender's UI.
+
+    Jobs are functions called as job(sock, *args) on the worker thread, their results are
+    delivered through concurrent.futures.Future objects. The queue holds at most `max_queue` jobs,
+    when it is full a droppable job (e.g. a live view frame) replaces the oldest queued droppable job.
+    """
+
+    def __init__(self, sock, max_queue=2):
+        self.sock = sock
+        self.max_queue = max_queue
+        # (job, args, future, droppable, time queued)
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._running = True
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        # seconds from submitting the last finished job until its response arrived
+        self.last_latency = 0.0
+        self._thread = threading.Thread(target=self._run, name="HoloPlay Service sender")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+    def submit(self, job, *args, droppable=False, block=True):
+        """ queues job(sock, *args) and returns a Future of its result. When the queue is full a droppable job replaces
+        the oldest queued droppable job. Otherwise the call waits for room, or with `block` False the new job is dropped
+        instead and its Future is returned cancelled, which is what the main thread wants """
+        future = Future()
+        with self._condition:
+            while self._running and len(self._queue) >= self.max_queue:
+                if droppable:
+                    oldest = next((item for item in self._queue if item[3]), None)
+                    if oldest is not None:
+                        self._queue.remove(oldest)
+                        oldest[2].cancel()
+                        self.dropped += 1
+                        continue
+                if not block:
+                    future.cancel()
+                    self.dropped += 1
+                    return future
+                # nothing we may drop, wait for the worker to make room
+                self._condition.wait()
+            if not self._running:
+                raise RuntimeError("The HoloPlay Service sender has been stopped")
+            self._queue.append((job, args, future, droppable, timeit.default_timer()))
+            self._condition.notify_all()
+        return future
+
+    def stop(self):
+        """ stops the worker after the job it is running and cancels the queued jobs. Returns right away, so a send
+        waiting for the service does not hold up the caller. The worker closes the socket when it is done with it """
+        with self._condition:
+            self._running = False
+            for item in self._queue:
+                item[2].cancel()
+            self._queue.clear()
+            self._condition.notify_all()
+
+    def _run(self):
+        try:
+            while True:
+                with self._condition:
+                    while self._running and not self._queue:
+                        self._condition.wait()
+                    if not self._running:
+                        return
+                    job, args, future, droppable, queued_time = self._queue.popleft()
+                    self._condition.notify_all()
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    result = job(self.sock, *args)
+                except BaseException as e:
+                    self.failed += 1
+                    future.set_exception(e)
+                    continue
+                self.sent += 1
+                self.last_latency = timeit.default_timer() - queued_time
+                future.set_result(result)
+        finally:
+            self.sock.close()
+
+def submit_quilt(quilt, top_down=False, droppable=False, block=False):
+    """ queues the quilt for the sender thread, which encodes and sends it. `quilt`: Blender image datablock or uint8 RGBA
+    numpy array of the size of the quilt, `top_down` if the array starts with the top row. Returns a Future of the service
+    response, which is cancelled when the queue is full unless `block` waits for room. Failures end up in lastSendError.
+    Must be called from the main thread because the quilt settings are read from the window manager """
+    if sender == None:
+        raise RuntimeError("Not connected to HoloPlay Service")
     wm = bpy.context.window_manager
-    aspect = wm.aspect
-    W = wm.quiltX
-    H = wm.quiltY
-    vx = wm.tileX
-    vy = wm.tileY
-    vtotal = vx*vy
+    if isinstance(quilt, np.ndarray):
+        pixels, W, H = quilt, wm.quiltX, wm.quiltY
+    else:
+        pixels, W, H = quilt_pixels_from_image(quilt)
+        top_down = False
+    future = sender.submit(send_quilt_pixels, pixels, W, H, quilt_settings(), top_down, raw_quilts_enabled(),
+                           droppable=droppable, block=block)
+    future.add_done_callback(_check_quilt_sent)
+    return future
+
+def _check_quilt_sent(future):
+    """ done callback of submitted quilts, runs on the sender thread. Keeps the last failure for the panel """
+    global lastSendError
+
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error != None:
+        lastSendError = repr(error)
+    elif not response_ok(future.result()):
+        lastSendError = "HoloPlay Service error: " + repr(future.result().get('error'))
+    else:
+        lastSendError = None
+        return
+    print("Sending quilt failed: " + lastSendError)
+
+def shutdown():
+    """ stops the sender thread, which closes the socket once it has finished the job it is running.
+    Called when the addon is unregistered and before reconnecting """
+    global sender
+    global sock
+    if sender != None:
+        sender.stop()
+        sender = None
+    sock = None
+
+def send_quilt(sock, quilt, top_down=False):
+    """ sends the quilt and waits for the response of HoloPlay Service, see submit_quilt. The socket belongs to the sender
+    thread, so the quilt goes through it as well and `sock` is only kept for compatibility """
+    start_time = timeit.default_timer()
+    response = submit_quilt(quilt, top_down=top_down, block=True).result()
+    print("Reading quilt and sending it to HoloPlay Service took in total: %.6f" % (timeit.default_timer() - start_time))
+    return response
 
-    from PIL import Image, ImageOps
+def send_quilt_from_np(sock, quilt, W=4096, H=4096, top_down=False):
+    # the resolution is always taken from the window manager, W and H are kept for compatibility
+    return send_quilt(sock, quilt, top_down=top_down)
 
+def _timed_stage(name, function):
+    """ runs one stage of the connection set up and records how long it took in initTimings """
     start_time = timeit.default_timer()
+    try:
+        return function()
+    finally:
+        initTimings[name] = timeit.default_timer() - start_time
 
-    # we get the data from the live view as numpy array
-    px0 = quilt
-    #W,H = px0.size
+def _connect(manifest_path):
+    """ the slow part of init(), run on a background thread. Returns (socket, info response), both None when the service is not running """
+    driver_url = "ipc:///tmp/holoplay-driver.ipc"
 
-    # we need to convert the 0-1 floats to integers from 0-255
-    # np.multiply(px0, 255, out=px0, casting="unsafe")
-    pixels=px0.astype(np.uint8, order="C")
+    global missingPackages
 
-    pimg_time = timeit.default_timer()
-    # for some reason the following only works when we create a PIL Image from a bytes-stream
-    # so we need to convert the numpy array to bytes and read that
-    pimg = Image.frombytes("RGBA", (W,H),  pixels.tobytes())
+    missingPackages = _timed_stage("dependencies", lambda: check_site_packages(DEPENDENCIES, manifest_path))
+    if missingPackages:
+        print("Missing Python packages: " + ", ".join(missingPackages))
+        return None, None
 
+    import pynng
+
+    # HoloPlay Service answers the same on ws://localhost:11222/driver
+    addr = driver_url
 
-    # the result is flipped, probably due to numpy, flip it back
-    pimg_flipped = ImageOps.flip(pimg)
-    print("Converting pixels to bytes-stream and flipping took: %.6f" % (timeit.default_timer() - pimg_time))
+    # the accelerated codec is built in the background and takes over once it is there
+    _timed_stage("cbor accelerator", ensure_cbor_accelerator)
 
-    # the idea is that we convert the PIL image to a simple file format HoloPlay Service / stb_image can read
-    # and store it in a BytesIO object instead of disk
-    output = io.BytesIO()
-    pimg_flipped.convert('RGBA').save(output, 'BMP')
+    new_sock = pynng.Req0(recv_timeout=2000)
+    try:
+        _timed_stage("connect", lambda: new_sock.dial(addr, block = True))
+    except:
+        print("Could not open socket. Is driver running?")
+        new_sock.close()
+        return None, None
 
-    # the contents of the BytesIO object becomes our blob we send to HoloPlay Service
-    blob = output.getvalue()
-    settings = {'vx': vx,'vy': vy,'vtotal': vtotal,'aspect': aspect}
-    send_message(sock, show_quilt(blob, settings))
-    print("Reading quilt from numpy array and sending it to HoloPlay Service took in total: %.6f" % (timeit.default_timer() - start_time))
+    try:
+        response = _timed_stage("info", lambda: send_message(new_sock, {'cmd':{'info':{}},'bin':''}))
+    except:
+        new_sock.close()
+        raise
+    return new_sock, response
+
+def _run_init(future, manifest_path):
+    if future.set_running_or_notify_cancel():
+        try:
+            future.set_result(_connect(manifest_path))
+        except BaseException as e:
+            future.set_exception(e)
+
+def _close_unused(future):
+    """ done callback closing the socket of a background init that finished after it was cancelled """
+    if not future.cancelled() and future.exception() == None:
+        unused_sock, response = future.result()
+        if unused_sock != None:
+            unused_sock.close()
+
+def init(block=False):
+    """ connects to HoloPlay Service and reads the device settings. The slow part runs on a background thread and
+    is applied by a bpy.app.timers function, so Blender stays responsive. With `block` it waits for it instead.
+    Returns None, so it can be registered as a timer itself """
+    global connectionState
+    global initStartTime
+    global _initFuture
+
+    if _initFuture != None:
+        if not _initFuture.done():
+            # already connecting, make sure the result still gets applied
+            if not bpy.app.timers.is_registered(_poll_init):
+                bpy.app.timers.register(_poll_init, first_interval=0.05, persistent=True)
+            return None
+        # finished, but never applied, start over with a fresh connection
+        _initFuture.add_done_callback(_close_unused)
+        _initFuture = None
 
-def init():
-    global hp
+    print("Init Settings")
+    initStartTime = timeit.default_timer()
+    initTimings.clear()
+    connectionState = "connecting"
+    _redraw_panels()
+
+    # the old sender owns the old socket
+    shutdown()
+
+    # a new connection may talk to a restarted service that does not know our cached quilts
+    clear_quilt_cache()
+
+    # bpy is only safe on the main thread, so the paths the background part needs are looked up here
+    manifest_path = dependency_manifest_path()
+
+    _initFuture = Future()
+    thread = threading.Thread(target=_run_init, args=(_initFuture, manifest_path), name="HoloPlay Service init")
+    thread.daemon = True
+    thread.start()
+    if block:
+        thread.join()
+        _poll_init()
+    elif not bpy.app.timers.is_registered(_poll_init):
+        # persistent, so loading a file while connecting does not drop it
+        bpy.app.timers.register(_poll_init, first_interval=0.05, persistent=True)
+    return None
+
+def cancel_init():
+    """ drops a background init that has not finished yet, called when the addon is unregistered """
+    global _initFuture
+    global connectionState
+
+    for timer in (init, _poll_init):
+        if bpy.app.timers.is_registered(timer):
+            bpy.app.timers.unregister(timer)
+    if _initFuture != None:
+        _initFuture.add_done_callback(_close_unused)
+        _initFuture = None
+        connectionState = "disconnected"
+
+def _poll_init():
+    """ bpy.app.timers function applying the result of the background init on the main thread once it is there """
+    global _initFuture
+
+    if _initFuture == None:
+        return None
+    if not _initFuture.done():
+        return 0.05
+    future = _initFuture
+    _initFuture = None
+    try:
+        new_sock, response = future.result()
+    except Exception as e:
+        print("Connecting to HoloPlay Service failed: " + repr(e))
+        new_sock, response = None, None
+    _timed_stage("apply", lambda: _apply_init(new_sock, response))
+
+    print("Init stages: " + ", ".join("%s %.6f" % (name, seconds) for name, seconds in initTimings.items()))
+    print("Init Settings took in total: %.6f" % (timeit.default_timer() - initStartTime))
+    _redraw_panels()
+    return None
+
+def _apply_init(new_sock, response):
     global sock
     global numDevices
     global screenW
     global screenH
     global aspect
     global hardwareVersion
-
-    print("Init Settings")
-    start_time = timeit.default_timer()
+    global sender
+    global connectionState
 
     wm = bpy.context.window_manager
 
-    ws_url = "ws://localhost:11222/driver"
-    driver_url = "ipc:///tmp/holoplay-driver.ipc"
-
-    ensure_site_packages([
-        ("pynng","pynng"),
-        ("PIL", "Pillow")
-    ])
-
-    import pynng
-
-    # This script should work identically whether addr = driver_url or addr = ws_url
-    addr = driver_url
-
-    sock = pynng.Req0(recv_timeout=2000)
-    try:
-        sock.dial(addr, block = True)
-    except:
-        print("Could not open socket. Is driver running?")
-        sock = None
-        return False
+    sock = new_sock
+    if sock == None:
+        connectionState = "failed"
+        return
 
-    response = send_message(sock, {'cmd':{'info':{}},'bin':''})
+    # from now on the socket is only used from the sender thread
+    sender = QuiltSender(sock)
+    connectionState = "connected"
     if response != None:
         # create a dictionary with an index for this device
         devices = response['devices']
@@ -238,8 +687,19 @@ def init():
             # print(hardwareVersion)
             wm.numDevicesConnected = 1 # temporarily support only one device due to the way we globally store vars in the wm
 
+    numDevices = wm.numDevicesConnected
     print("Number of devices found: " + str(wm.numDevicesConnected))
 
+def _redraw_panels():
+    """ the panel shows the connection state, which changes outside of any operator """
+    wm = bpy.context.window_manager
+    if wm == None:
+        return
+    for window in wm.windows:
+        for area in window.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
 class looking_glass_reconnect_to_holoplay_service(bpy.types.Operator):
     """ Reconnects to Holoplay Service """
     bl_idname = "lookingglass.reconnect_to_holoplay_service"
@@ -249,4 +709,112 @@ class looking_glass_reconnect_to_holoplay_service(bpy.types.Operator):
 
     def execute(self, context):
         init()
+        self.report({'INFO'}, "Connecting to HoloPlay Service")
         return {'FINISHED'}
+
+class looking_glass_install_dependencies(bpy.types.Operator):
+    """ Installs the missing Python packages with pip """
+    bl_idname = "lookingglass.install_dependencies"
+    bl_label = "Install Dependencies"
+    bl_description = "Installs the Python packages the addon needs with pip, then connects to HoloPlay Service"
+
+    def execute(self, context):
+        global installStatus
+
+        if installStatus != None:
+            self.report({'WARNING'}, "The dependencies are already being installed")
+            return {'CANCELLED'}
+
+        packages = missingPackages or [pip_name for import_name, pip_name in DEPENDENCIES]
+        python = python_binary()
+        self._commands = [
+            [python, '-m', 'ensurepip'],
+            [python, '-m', 'pip', 'install', *packages, "--user"],
+        ]
+        # steps that may fail without failing the install
+        self._optional_steps = set()
+        from .cbor import _cbor_build
+        if _cbor_build.extension_path() is None and _cbor_build.have_compiler():
+            # the optional C part of the cbor package, built with the cffi pip has just installed along with pynng
+            self._optional_steps.add(len(self._commands))
+            self._commands.append([python, _cbor_build.__file__])
+        self._step = 0
+        self._process = None
+        self._reader = None
+        # output lines of pip, put there by the reader thread and shown by modal() on the main thread
+        self._output = queue.Queue()
+        installStatus = "Installing " + ", ".join(packages)
+
+        wm = context.window_manager
+        wm.progress_begin(0, len(self._commands))
+        self._timer = wm.event_timer_add(0.2, window=context.window)
+        wm.modal_handler_add(self)
+        self._start_step()
+        return {'RUNNING_MODAL'}
+
+    def _start_step(self):
+        import subprocess
+
+        self._process = subprocess.Popen(self._commands[self._step], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                         universal_newlines=True)
+        self._reader = threading.Thread(target=self._read_output, args=(self._process, self._output), name="pip output")
+        self._reader.daemon = True
+        self._reader.start()
+
+    @staticmethod
+    def _read_output(process, output):
+        for line in process.stdout:
+            output.put(line)
+
+    def _show_output(self):
+        """ prints the pip output read so far and shows its last line in the panel """
+        global installStatus
+
+        while True:
+            try:
+                line = self._output.get_nowait()
+            except queue.Empty:
+                return
+            print(line, end='')
+            if line.strip():
+                installStatus = line.strip()
+
+    def modal(self, context, event):
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+        self._show_output()
+        _redraw_panels()
+        returncode = self._process.poll()
+        if returncode == None:
+            return {'RUNNING_MODAL'}
+        # the process is gone, so its output ends soon and nothing of it is left behind for the next step
+        self._reader.join()
+        self._show_output()
+        if returncode != 0 and self._step in self._optional_steps:
+            print("Building the CBOR accelerator failed, using the pure Python codec")
+        elif returncode != 0:
+            self._finish(context)
+            self.report({'ERROR'}, "Installing the dependencies failed, see the system console")
+            return {'CANCELLED'}
+
+        self._step += 1
+        context.window_manager.progress_update(self._step)
+        if self._step < len(self._commands):
+            self._start_step()
+            return {'RUNNING_MODAL'}
+
+        self._finish(context)
+        import importlib
+        importlib.invalidate_caches()
+        self.report({'INFO'}, "Dependencies installed")
+        init()
+        return {'FINISHED'}
+
+    def _finish(self, context):
+        global installStatus
+
+        installStatus = None
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        _redraw_panels()
@@ -0,0 +1,62 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Encodes quilt pixels for HoloPlay Service. Imports neither bpy nor bgl, so it can be
+# used and benchmarked outside of Blender, see benchmarks/bench_quilt_transports.py
+
+import struct
+from . lazy_import import lazy_import
+from . holoplay_service_api_commands import raw_quilt_format
+
+np = lazy_import("numpy")
+
+# BMP file header (14 bytes) followed by a BITMAPV4HEADER (108 bytes) whose channel masks
+# describe RGBA byte order, so the pixels read back from OpenGL can be used without swizzling
+_BMP_HEADER_SIZE = 14 + 108
+
+def bmp_header(W, H, top_down=False):
+    """ header of a 32 bit RGBA BMP with W*H pixels, rows stored bottom-up like OpenGL and Blender images unless `top_down` """
+    image_size = W * H * 4
+    file_header = struct.pack('<2sIHHI', b'BM', _BMP_HEADER_SIZE + image_size, 0, 0, _BMP_HEADER_SIZE)
+    # positive height means bottom-up rows, compression 3 is BI_BITFIELDS, 2835 px/m is 72 dpi
+    height = -H if top_down else H
+    info_header = struct.pack('<IiiHHIIiiII', 108, W, height, 1, 32, 3, image_size, 2835, 2835, 0, 0)
+    # red, green, blue and alpha masks, then the 'sRGB' colour space tag and unused endpoints and gamma
+    masks = struct.pack('<IIII', 0x000000ff, 0x0000ff00, 0x00ff0000, 0xff000000)
+    colour_space = struct.pack('<4s48x', b'BGRs')
+    return file_header + info_header + masks + colour_space
+
+def encode_quilt_bmp(pixels, W, H, top_down=False):
+    """ `pixels`: W*H uint8 RGBA values, bottom row first unless `top_down`. Returns the BMP file as bytes, copying the pixels once """
+    pixels = np.ascontiguousarray(pixels, dtype=np.uint8)
+    return b''.join((bmp_header(W, H, top_down), memoryview(pixels).cast('B')))
+
+def encode_quilt_raw(pixels, W, H, channels=3, top_down=False, service_flips=False):
+    """ `pixels`: W*H uint8 RGBA values, bottom row first unless `top_down`. Returns (bytes, format) with the alpha channel
+    dropped when `channels` is 3, copying the pixels once. Bottom-up rows are flipped here unless `service_flips` leaves that to HoloPlay Service """
+    pixels = np.asarray(pixels, dtype=np.uint8).reshape(H, W, 4)
+    flip_y = False
+    if not top_down:
+        if service_flips:
+            flip_y = True
+        else:
+            # CPU fallback, the readback can do this on the GPU, see looking_glass_settings.quilt_wants_top_down
+            pixels = pixels[::-1]
+    # flipping and dropping alpha are only views, tobytes does the single copy
+    blob = pixels[:, :, :channels].tobytes()
+    return blob, raw_quilt_format(W, H, channels, flip_y)
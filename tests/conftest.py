@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the cbor package is vendored inside the addon and imported as a top-level package,
+# the addon itself can not be imported outside of Blender
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'looking_glass_tools'))
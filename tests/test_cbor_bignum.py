@@ -0,0 +1,103 @@
+import io
+import random
+
+import pytest
+
+from cbor.cbor import _decode, dumps, load, loads
+
+
+def _ints_around(center, spread=3):
+    return [center + offset for offset in range(-spread, spread + 1)]
+
+
+# the 64 bit boundary, where the tag 2 and tag 3 bignums start
+BOUNDARY_INTS = sorted(set(
+    _ints_around(2 ** 63) + _ints_around(2 ** 64) +
+    [-value for value in _ints_around(2 ** 63) + _ints_around(2 ** 64)] +
+    list(range(2 ** 64 - 300, 2 ** 64 + 300, 7)) +
+    list(range(-2 ** 64 - 300, -2 ** 64 + 300, 7))
+))
+
+
+def _int_id(value):
+    return '{0}{1}bits'.format('-' if value < 0 else '', value.bit_length())
+
+
+def _roundtrips(value):
+    encoded = dumps(value)
+    assert loads(encoded) == value
+    assert _decode(bytearray(encoded), zero_copy=True)[0] == value
+    # and through the stream decoder
+    assert load(io.BytesIO(encoded)) == value
+    return encoded
+
+
+@pytest.mark.parametrize('value', BOUNDARY_INTS)
+def test_64_bit_boundary(value):
+    encoded = _roundtrips(value)
+    if -2 ** 64 <= value < 2 ** 64:
+        # still a plain integer
+        assert encoded[0] >> 5 in (0, 1)
+    else:
+        assert encoded[0] == (0xc2 if value > 0 else 0xc3)
+    _roundtrips([value, {'n': value}])
+
+
+@pytest.mark.parametrize('value, encoded', [
+    (2 ** 64 - 1, b'\x1b' + b'\xff' * 8),
+    (2 ** 64, b'\xc2\x49\x01' + b'\x00' * 8),
+    (2 ** 64 + 1, b'\xc2\x49\x01' + b'\x00' * 7 + b'\x01'),
+    (-2 ** 64, b'\x3b' + b'\xff' * 8),
+    (-2 ** 64 - 1, b'\xc3\x49\x01' + b'\x00' * 8),
+    (-2 ** 64 - 2, b'\xc3\x49\x01' + b'\x00' * 7 + b'\x01'),
+], ids=repr)
+def test_bignum_encoding(value, encoded):
+    assert dumps(value) == encoded
+    assert loads(encoded) == value
+
+
+@pytest.mark.parametrize('n', range(0, 1100, 7))
+def test_powers_of_two(n):
+    for value in (2 ** n - 1, 2 ** n, 2 ** n + 1, -2 ** n, -1 - 2 ** n, -2 - 2 ** n):
+        _roundtrips(value)
+
+
+@pytest.mark.parametrize('bits', [8 * 1024, 8 * 4096, 8 * 65536], ids=lambda bits: '%dbytes' % (bits // 8))
+def test_multi_kilobyte_ints(bits):
+    rng = random.Random(bits)
+    value = rng.getrandbits(bits) | (1 << (bits - 1))
+    for signed in (value, -1 - value):
+        encoded = _roundtrips(signed)
+        # tag, byte string header with a 16 or 32 bit length, then exactly the bytes of the value
+        assert len(encoded) in (1 + 3 + bits // 8, 1 + 5 + bits // 8)
+
+
+def test_bignum_bytes_are_minimal():
+    rng = random.Random(16)
+    for _ in range(500):
+        value = rng.getrandbits(rng.randint(65, 2000)) | (1 << 64)
+        for signed in (value, -1 - value):
+            payload, end = _decode(dumps(signed)[1:])
+            assert end == len(dumps(signed)) - 1
+            assert payload[:1] != b'\x00'
+
+
+def test_non_minimal_bignums_decode():
+    assert loads(b'\xc2\x40') == 0
+    assert loads(b'\xc3\x40') == -1
+    assert loads(b'\xc2\x43\x00\x00\x05') == 5
+    assert loads(b'\xc3\x42\x00\x05') == -6
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_random_roundtrip(seed):
+    # property style: random ints of every size up to a few hundred bits, alone and in containers
+    rng = random.Random(seed)
+    values = []
+    for _ in range(300):
+        value = rng.getrandbits(rng.randint(0, 300))
+        values.append(value if rng.random() < 0.5 else -1 - value)
+    for value in values:
+        _roundtrips(value)
+    _roundtrips(values)
+    _roundtrips(dict(('k%d' % i, v) for i, v in enumerate(values)))
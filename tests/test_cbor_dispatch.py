@@ -0,0 +1,30 @@
+import sys
+import types
+
+import cbor
+from cbor import dumps, loads
+from cbor import cbor as pycbor
+from cbor.tagmap import TagMapper
+
+
+def test_use_accelerator_reaches_imported_functions(monkeypatch):
+    calls = []
+    fake = types.ModuleType('cbor._cbor')
+    fake.dumps = lambda ob, sort_keys, hook: calls.append('dumps') or pycbor.dumps(ob, sort_keys, hook)
+    fake.loads = lambda data, zero_copy, tag_hook: calls.append('loads') or pycbor.loads(data, zero_copy, tag_hook)
+    monkeypatch.setitem(sys.modules, 'cbor._cbor', fake)
+    monkeypatch.setattr(cbor, '_cbor', fake, raising=False)
+    monkeypatch.setattr(cbor, '_impl', pycbor)
+    monkeypatch.setattr(cbor, 'accelerated', False)
+
+    assert loads(dumps({'a': 1})) == {'a': 1}
+    assert calls == []
+    assert cbor.use_accelerator()
+    assert cbor.accelerated
+    # functions imported before the switch use the accelerator from now on
+    assert loads(dumps({'a': 1})) == {'a': 1}
+    assert calls == ['dumps', 'loads']
+    # and so does the tag mapper
+    mapper = TagMapper()
+    assert mapper.loads(mapper.dumps([1])) == [1]
+    assert calls == ['dumps', 'loads', 'dumps', 'loads']
@@ -0,0 +1,70 @@
+import pytest
+
+from cbor.cbor import Slot, Template, _dumps_int, dumps, loads
+from cbor import cbor as pycbor
+
+
+# up to the 64 bit limit of the int encoders, the bignums beyond are tested in test_cbor_bignum.py
+BOUNDARY_INTS = sorted(set(
+    sign * (base + offset)
+    for base in (0, 23, 24, 255, 256, 1023, 1024, 65535, 65536, 2 ** 32 - 1, 2 ** 32, 2 ** 64 - 1)
+    for offset in (-1, 0, 1)
+    for sign in (1, -1)
+    if -2 ** 64 <= sign * (base + offset) < 2 ** 64
+))
+
+
+@pytest.mark.parametrize('value', BOUNDARY_INTS)
+def test_int_cache_boundaries(value):
+    # cached or not, ints are encoded like the uncached encoder does, in the shortest form
+    assert dumps(value) == _dumps_int(value)
+    assert Template([Slot('n')]).dumps(n=value) == dumps([value])
+    assert loads(dumps(value)) == value
+
+
+@pytest.mark.parametrize('value, encoded', [
+    (23, b'\x17'),
+    (24, b'\x18\x18'),
+    (255, b'\x18\xff'),
+    (256, b'\x19\x01\x00'),
+    (65535, b'\x19\xff\xff'),
+    (65536, b'\x1a\x00\x01\x00\x00'),
+    (-24, b'\x37'),
+    (-25, b'\x38\x18'),
+    (-256, b'\x38\xff'),
+    (-257, b'\x39\x01\x00'),
+    (-65536, b'\x39\xff\xff'),
+    (-65537, b'\x3a\x00\x01\x00\x00'),
+])
+def test_int_encoding(value, encoded):
+    assert dumps(value) == encoded
+
+
+@pytest.mark.parametrize('length', [
+    0, 1, 23, 24, 31,
+    pycbor._TEXT_CACHE_MAX_LEN, pycbor._TEXT_CACHE_MAX_LEN + 1,
+    255, 256, 65535, 65536,
+])
+def test_text_lengths(length):
+    text = 'a' * length
+    encoded = dumps(text)
+    # twice, the second time through the text cache when it is short enough
+    assert dumps(text) == encoded
+    assert encoded == pycbor.dumps_string(text, is_text=True)
+    assert Template({'name': Slot('name')}).dumps(name=text) == dumps({'name': text})
+    assert loads(encoded) == text
+
+
+def test_long_text_is_not_cached():
+    text = u'é' * pycbor._TEXT_CACHE_MAX_LEN
+    dumps(text)
+    assert text not in pycbor._TEXT_CACHE
+    assert loads(dumps(text)) == text
+
+
+def test_text_cache_stops_growing(monkeypatch):
+    monkeypatch.setattr(pycbor, '_TEXT_CACHE', {})
+    for i in range(pycbor._TEXT_CACHE_SIZE + 10):
+        text = 'key%d' % i
+        assert dumps(text) == pycbor.dumps_string(text, is_text=True)
+    assert len(pycbor._TEXT_CACHE) == pycbor._TEXT_CACHE_SIZE
@@ -0,0 +1,107 @@
+import importlib
+import os
+import random
+
+import pytest
+
+from cbor import cbor as pycbor
+from cbor import _cbor_build
+from cbor.cbor import Slot, Tag, Template
+
+
+@pytest.fixture(scope='module')
+def accel():
+    """the C accelerated codec, built for the test run when it has not been built before"""
+    built = None
+    if _cbor_build.extension_path() is None:
+        if not _cbor_build.have_compiler():
+            pytest.skip('no C compiler to build the CBOR accelerator')
+        try:
+            built = _cbor_build.build()
+        except Exception as e:
+            pytest.skip('the CBOR accelerator can not be built here: {0!r}'.format(e))
+    try:
+        yield importlib.import_module('cbor._cbor')
+    finally:
+        if built is not None:
+            os.remove(built)
+
+
+def _copied(value):
+    if isinstance(value, memoryview):
+        return value.tobytes()
+    if isinstance(value, list):
+        return [_copied(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, _copied(v)) for k, v in value.items())
+    if isinstance(value, Tag):
+        return Tag(value.tag, _copied(value.value))
+    return value
+
+
+def _outcome(fn, *args, **kwargs):
+    try:
+        return ('ok', _copied(fn(*args, **kwargs)))
+    except Exception as e:
+        return ('error', type(e))
+
+
+def _assert_same(accel, ob):
+    for sort_keys in (False, True):
+        encoded = pycbor.dumps(ob, sort_keys=sort_keys)
+        assert accel.dumps(ob, sort_keys=sort_keys) == encoded
+    _assert_same_decode(accel, encoded)
+
+
+def _assert_same_decode(accel, blob):
+    for zero_copy in (False, True):
+        for data in (blob, bytearray(blob)):
+            assert _outcome(accel.loads, data, zero_copy=zero_copy) == _outcome(pycbor.loads, data, zero_copy=zero_copy)
+
+
+def test_check_parity(accel):
+    assert accel.check_parity() > 0
+
+
+def test_corpus(accel):
+    for ob in accel._parity_corpus(300, seed=7):
+        _assert_same(accel, ob)
+
+
+def test_decoder_only_blobs(accel):
+    for blob in accel._PARITY_BLOBS:
+        _assert_same_decode(accel, blob)
+
+
+@pytest.mark.parametrize('value', [
+    2 ** 63 - 1, 2 ** 63, 2 ** 64 - 1, 2 ** 64, 2 ** 64 + 1,
+    -2 ** 63, -2 ** 64, -2 ** 64 - 1, -2 ** 64 - 2,
+    2 ** 20000 + 1, -1 - 2 ** 20000,
+], ids=lambda value: '{0}{1} bits'.format('-' if value < 0 else '', value.bit_length()))
+def test_bignums(accel, value):
+    _assert_same(accel, value)
+    _assert_same(accel, [value] * 20)
+    _assert_same(accel, {'n': value})
+
+
+def test_templates(accel):
+    settings = Template({'vx': Slot('vx'), 'vy': Slot('vy'), 'aspect': 0.75})
+    message = Template({'cmd': {'show': {'name': Slot('name'), 'settings': Slot('settings')}}, 'bin': Slot('bin')})
+    filled = message.fill(name='quilt', settings=settings.fill(vx=5, vy=9), bin=b'\x01' * 70000)
+    _assert_same(accel, filled)
+    _assert_same(accel, [filled, Template([Slot('a'), 2 ** 70]).fill(a=[1.5] * 32)])
+
+
+def test_indefinite_length_input(accel):
+    rng = random.Random(3)
+    for _ in range(200):
+        items = [rng.randint(-2 ** 40, 2 ** 40) for _ in range(rng.randint(0, 40))]
+        blob = b'\x9f' + b''.join(pycbor.dumps(i) for i in items) + b'\xff'
+        _assert_same_decode(accel, blob)
+        chunks = [bytes(rng.randint(0, 255) for _ in range(rng.randint(0, 20))) for _ in range(rng.randint(0, 5))]
+        blob = b'\x5f' + b''.join(pycbor.dumps(c) for c in chunks) + b'\xff'
+        _assert_same_decode(accel, blob)
+        text = [u'\xe9t\xe9' * rng.randint(0, 5) for _ in range(rng.randint(0, 5))]
+        blob = b'\xbf' + b''.join(pycbor.dumps(u'k%d' % i) + b'\x7f' + b''.join(pycbor.dumps(t) for t in text) + b'\xff'
+                                  for i in range(rng.randint(0, 5))) + b'\xff'
+        _assert_same_decode(accel, blob)
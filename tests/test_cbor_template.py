@@ -0,0 +1,103 @@
+import pytest
+
+from cbor.cbor import Slot, Tag, Template, TemplateList, TemplateObject, dumps, loads
+
+
+def _slot_values():
+    return [
+        None,
+        True,
+        False,
+        0,
+        -1,
+        1.5,
+        float('inf'),
+        b'',
+        b'\x00\xffbytes',
+        bytearray(b'bytearray'),
+        memoryview(b'memoryview'),
+        '',
+        'text',
+        u'été \U0001f600',
+        'x' * 100,
+        [],
+        [1, 'two', [3.0, None]],
+        (1, 2),
+        {},
+        {'a': 1, 'b': [b'c', {'d': None}]},
+        Tag(1234, 'tagged'),
+    ]
+
+
+def _plain(value):
+    # what a slot value stands for when encoded without a template
+    if isinstance(value, TemplateObject):
+        return dict(value)
+    if isinstance(value, TemplateList):
+        return list(value)
+    return value
+
+
+@pytest.mark.parametrize('value', _slot_values(), ids=repr)
+def test_slot_types_match_dumps(value):
+    shape = {'cmd': {'show': {'value': Slot('value')}}, 'bin': b'static'}
+    filled = Template(shape).fill(value=value)
+    assert dumps(filled) == dumps({'cmd': {'show': {'value': value}}, 'bin': b'static'})
+
+
+def test_shape_must_be_a_container():
+    with pytest.raises(TypeError):
+        Template(Slot('value'))
+
+
+def test_list_shape():
+    filled = Template([Slot('a'), {'b': Slot('b')}]).fill(a=1, b=[2])
+    assert filled == [1, {'b': [2]}]
+    assert dumps(filled) == dumps([1, {'b': [2]}])
+    # a hook sees the filled template as a whole, it is not taken apart like a plain list
+    assert dumps(filled, hook=lambda ob: ob) == dumps([1, {'b': [2]}])
+
+
+def test_slots_in_lists_and_repeated():
+    shape = [Slot('a'), 'between', Slot('b'), [Slot('a'), {'k': Slot('b')}]]
+    template = Template(shape)
+    assert template.slot_names == {'a', 'b'}
+    assert dumps(template.fill(a=1, b='two')) == dumps([1, 'between', 'two', [1, {'k': 'two'}]])
+
+
+def test_template_dumps_method():
+    template = Template({'name': Slot('name'), 'bin': Slot('bin')})
+    assert template.dumps(name='quilt', bin=b'xyz') == dumps({'name': 'quilt', 'bin': b'xyz'})
+
+
+def test_sort_keys():
+    shape = {'b': Slot('b'), 'a': {'y': 1, 'x': Slot('x')}}
+    template = Template(shape, sort_keys=True)
+    expected = dumps({'b': {'z': 1, 'c': 2}, 'a': {'y': 1, 'x': 3}}, sort_keys=True)
+    assert dumps(template.fill(b={'z': 1, 'c': 2}, x=3)) == expected
+
+
+def test_nested_templates():
+    settings = Template({'vx': Slot('vx'), 'vy': Slot('vy'), 'aspect': 0.75})
+    message = Template({'cmd': {'show': {'settings': Slot('settings')}}, 'bin': Slot('bin')})
+    inner = settings.fill(vx=5, vy=9)
+    filled = message.fill(settings=inner, bin=b'\x01' * 300)
+    expected = dumps({'cmd': {'show': {'settings': {'vx': 5, 'vy': 9, 'aspect': 0.75}}}, 'bin': b'\x01' * 300})
+    assert dumps(filled) == expected
+    # and a filled template nested in plain containers
+    assert dumps([inner, {'again': inner}]) == dumps([_plain(inner), {'again': _plain(inner)}])
+    pair = Template([Slot('settings'), 0]).fill(settings=inner)
+    assert dumps({'pair': pair}) == dumps({'pair': _plain(pair)})
+
+
+def test_filled_template_reads_like_its_dict():
+    template = Template({'cmd': {'name': Slot('name')}, 'list': [Slot('n')]})
+    filled = template.fill(name='a', n=1)
+    assert filled == {'cmd': {'name': 'a'}, 'list': [1]}
+    assert loads(dumps(filled)) == filled
+
+
+def test_missing_value():
+    template = Template({'a': Slot('a'), 'b': Slot('b')})
+    with pytest.raises(KeyError):
+        template.fill(a=1)
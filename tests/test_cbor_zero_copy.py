@@ -0,0 +1,108 @@
+import pytest
+
+from cbor.cbor import Tag, _decode, dumps, loads
+
+
+VALUES = [
+    b'',
+    b'bytes',
+    b'\x00' * 70000,
+    [b'a', b'bc', [b'def']],
+    {'bin': b'\x01\x02', 'cmd': {'name': 'quilt', 'data': [b'x', 1, None]}},
+    {b'key': b'value'},
+    Tag(1234, b'tagged'),
+    ['text', 1, -1, 2.5, True, None],
+]
+
+
+def _copied(value):
+    # value with every memoryview turned into bytes
+    if isinstance(value, memoryview):
+        return value.tobytes()
+    if isinstance(value, list):
+        return [_copied(v) for v in value]
+    if isinstance(value, dict):
+        return dict((k, _copied(v)) for k, v in value.items())
+    if isinstance(value, Tag):
+        return Tag(value.tag, _copied(value.value))
+    return value
+
+
+def _byte_strings(value):
+    if isinstance(value, (bytes, memoryview)):
+        yield value
+    elif isinstance(value, list):
+        for v in value:
+            for b in _byte_strings(v):
+                yield b
+    elif isinstance(value, dict):
+        for v in value.values():
+            for b in _byte_strings(v):
+                yield b
+    elif isinstance(value, Tag):
+        for b in _byte_strings(value.value):
+            yield b
+
+
+@pytest.mark.parametrize('value', VALUES, ids=repr)
+@pytest.mark.parametrize('buffer_type', [bytes, bytearray])
+def test_zero_copy_equals_default_decode(value, buffer_type):
+    data = buffer_type(dumps(value))
+    copied, end = _decode(data)
+    viewed, zero_copy_end = _decode(data, zero_copy=True)
+    assert end == zero_copy_end == len(data)
+    assert _copied(viewed) == copied == value
+    assert _copied(loads(data, zero_copy=True)) == loads(data)
+
+
+@pytest.mark.parametrize('value', VALUES, ids=repr)
+@pytest.mark.parametrize('buffer_type', [bytes, bytearray])
+def test_byte_strings_are_views_of_the_input(value, buffer_type):
+    data = buffer_type(dumps(value))
+    for item in _byte_strings(_decode(data, zero_copy=True)[0]):
+        assert isinstance(item, memoryview)
+        assert item.obj is data
+    for item in _byte_strings(_decode(data)[0]):
+        assert type(item) is bytes
+
+
+def test_views_see_changes_to_the_input():
+    data = bytearray(dumps({'bin': b'abc'}))
+    view = _decode(data, zero_copy=True)[0]['bin']
+    data[data.index(b'abc')] = ord('x')
+    assert view == b'xbc'
+    # a copy made with tobytes() does not
+    copy = view.tobytes()
+    data[data.index(b'xbc')] = ord('y')
+    assert copy == b'xbc'
+
+
+@pytest.mark.parametrize('buffer_type', [bytes, bytearray])
+def test_byte_string_keys_are_copied(buffer_type):
+    data = buffer_type(dumps({b'key': b'value'}))
+    value = _decode(data, zero_copy=True)[0]
+    assert [type(key) for key in value] == [bytes]
+    assert value[b'key'].obj is data
+
+
+def test_decode_from_a_position():
+    first = dumps(b'first')
+    data = first + dumps([b'second'])
+    value, end = _decode(data, len(first), zero_copy=True)
+    assert end == len(data)
+    assert value[0].obj is data
+    assert value[0] == b'second'
+
+
+def test_indefinite_length_byte_strings_are_joined():
+    # chunked byte strings are not contiguous in the input, so they are copied
+    data = b'\x5f\x42ab\x41c\xff'
+    value = _decode(data, zero_copy=True)[0]
+    assert value == b'abc'
+    assert type(value) is bytes
+
+
+def test_truncated_input():
+    data = dumps({'bin': b'abcdef'})
+    with pytest.raises(EOFError):
+        _decode(data[:-1], zero_copy=True)